@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark du débit de connexion (POST /api/auth/login) de l'auth-service.
+
+Pour chaque nombre de processus de hachage (PASSWORD_HASH_WORKERS, 0 pour
+un hachage sur place dans le thread de la requête), le script charge
+l'auth-service sur une base SQLite temporaire, crée un utilisateur puis
+envoie des connexions simultanées depuis plusieurs threads. Il affiche le
+débit (connexions/s) et les latences p50/p95 de chaque configuration.
+
+Usage:
+    python benchmark_login.py --workers 0,1,2,4 --threads 16 --logins 200
+    python benchmark_login.py --method pbkdf2:sha256:600000
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from colorama import init, Fore, Style
+
+from seed_database import load_service
+
+# Initialiser colorama
+init()
+
+BENCH_USER = {
+    'username': 'bench.login',
+    'email': 'bench.login@clinic.com',
+    'password': 'Bench@1234',
+    'first_name': 'Bench',
+    'last_name': 'Login'
+}
+
+
+def print_info(text):
+    print(f"{Fore.CYAN}ℹ {text}{Style.RESET_ALL}")
+
+
+def print_error(text):
+    print(f"{Fore.RED}✗ {text}{Style.RESET_ALL}")
+
+
+def print_header(text):
+    print(f"\n{Fore.YELLOW}{'='*60}")
+    print(f"{text:^60}")
+    print(f"{'='*60}{Style.RESET_ALL}\n")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(workers, method, threads, logins):
+    """Mesurer `logins` connexions réparties sur `threads` threads"""
+    os.environ['PASSWORD_HASH_WORKERS'] = str(workers)
+    os.environ['PASSWORD_HASH_MAX_PENDING'] = str(max(threads, 1))
+    os.environ['LOGIN_RATE_LIMIT_IP'] = '0'
+    os.environ['LOGIN_RATE_LIMIT_USER'] = '0'
+    if method:
+        os.environ['PASSWORD_HASH_METHOD'] = method
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_login.db')}"
+    svc = load_service('auth-service', database_url)
+    with svc.app.app_context():
+        svc.db.create_all()
+    svc.app.test_client().post('/api/auth/register', json=BENCH_USER)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    per_thread = max(logins // threads, 1)
+    body = {'username': BENCH_USER['username'], 'password': BENCH_USER['password']}
+
+    def worker():
+        client = svc.app.test_client()
+        barrier.wait()
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            response = client.post('/api/auth/login', json=body)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    svc.password_hasher.shutdown()
+
+    return {
+        'workers': workers,
+        'method': svc.password_hasher.method,
+        'logins_per_s': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': percentile(latencies, 95),
+        'errors': len(errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du débit de connexion')
+    parser.add_argument('--workers', default=None,
+                        help='Nombres de processus de hachage à tester (ex: 0,1,2,4; défaut: 0,1,2,4... jusqu\'au nombre de cœurs)')
+    parser.add_argument('--method', help='PASSWORD_HASH_METHOD à utiliser (défaut: celle du service)')
+    parser.add_argument('--threads', type=int, default=16, help='Connexions simultanées')
+    parser.add_argument('--logins', type=int, default=200, help='Nombre total de connexions par configuration')
+    args = parser.parse_args()
+
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(',')]
+    else:
+        cores = os.cpu_count() or 1
+        worker_counts = [0] + [n for n in (1, 2, 4, 8, 16, 32) if n < cores] + [cores]
+
+    print_header(f"Connexions: {args.threads} threads, {args.logins} par configuration ({os.cpu_count()} cœurs)")
+    results = [run(w, args.method, args.threads, args.logins) for w in worker_counts]
+
+    print_info(f"Méthode: {results[0]['method']}")
+    print(f"{'Processus':>10} {'Connexions/s':>14} {'p50 (ms)':>10} {'p95 (ms)':>10} {'Erreurs':>8}")
+    for r in results:
+        label = 'sur place' if r['workers'] == 0 else str(r['workers'])
+        print(f"{label:>10} {r['logins_per_s']:>14.1f} {r['p50_ms']:>10.1f} {r['p95_ms']:>10.1f} {r['errors']:>8}")
+        if r['errors']:
+            print_error(f"{r['errors']} connexions en échec avec {label} processus")
+
+
+if __name__ == '__main__':
+    main()
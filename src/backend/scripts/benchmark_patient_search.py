@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la recherche de patients.
+
+Compare l'ancienne recherche ILIKE '%terme%' sur prénom, nom et email
+(scan complet de la table) à la recherche via l'index de recherche
+(FTS5 trigram sous SQLite), sur une base SQLite temporaire de N patients.
+
+Usage:
+    python benchmark_patient_search.py --rows 300000 --runs 5
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+from colorama import init, Fore, Style
+
+# Initialiser colorama
+init()
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services')
+
+FIRST_NAMES = ['Mohammed', 'Amina', 'Yasmine', 'Karim', 'Sofiane', 'Nadia', 'Rachid', 'Leila',
+               'Samir', 'Fatima', 'Youcef', 'Meriem', 'Omar', 'Sarah', 'Adel', 'Imane']
+LAST_NAMES = ['Benali', 'Hamadi', 'Mansouri', 'Boudiaf', 'Cherif', 'Khelifi', 'Saidi', 'Belkacem',
+              'Zerrouki', 'Bouzid', 'Haddad', 'Mebarki', 'Touati', 'Ait Ahmed', 'Brahimi', 'Lounis']
+SEARCH_TERMS = ['benali', 'yasm', 'khelifi', 'patient12345', 'zerrou']
+
+
+def print_header(text):
+    print(f"\n{Fore.YELLOW}{'='*60}")
+    print(f"{text:^60}")
+    print(f"{'='*60}{Style.RESET_ALL}\n")
+
+
+def print_info(text):
+    print(f"{Fore.CYAN}ℹ {text}{Style.RESET_ALL}")
+
+
+def load_service(service, database_url):
+    """Importer app.py d'un service avec une base de données donnée"""
+    service_dir = os.path.join(SERVICES_DIR, service)
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, service_dir)
+    spec = importlib.util.spec_from_file_location(service.replace('-', '_'), os.path.join(service_dir, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def seed_patients(svc, rows, chunk_size=50000):
+    """Insérer `rows` patients aléatoires par paquets"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    table = svc.Patient.__table__
+
+    for start in range(0, rows, chunk_size):
+        batch = [
+            {
+                'first_name': rng.choice(FIRST_NAMES),
+                'last_name': rng.choice(LAST_NAMES),
+                'email': f'patient{i}@example.com',
+                'phone': f'05{rng.randint(10000000, 99999999)}',
+                'date_of_birth': date(rng.randint(1940, 2020), rng.randint(1, 12), rng.randint(1, 28)),
+                'gender': rng.choice(['Homme', 'Femme']),
+                'created_at': now,
+                'updated_at': now
+            }
+            for i in range(start, min(start + chunk_size, rows))
+        ]
+        svc.db.session.execute(table.insert(), batch)
+        svc.db.session.commit()
+
+
+def legacy_search(svc, term, per_page=10):
+    """Ancienne implémentation de /api/patients?search= (ILIKE + COUNT)"""
+    Patient = svc.Patient
+    query = Patient.query.filter(
+        svc.db.or_(
+            Patient.first_name.ilike(f'%{term}%'),
+            Patient.last_name.ilike(f'%{term}%'),
+            Patient.email.ilike(f'%{term}%')
+        )
+    )
+    pagination = query.order_by(Patient.created_at.desc()).paginate(page=1, per_page=per_page, error_out=False)
+    return pagination.total
+
+
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la recherche de patients')
+    parser.add_argument('--rows', type=int, default=300000, help='Nombre de patients à générer')
+    parser.add_argument('--runs', type=int, default=5, help='Nombre de mesures par terme')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'benchmark_patients.db')
+    svc = load_service('patient-service', f'sqlite:///{db_path}')
+
+    with svc.app.app_context():
+        svc.db.create_all()
+        svc.setup_search_index()
+
+        print_header(f"Génération de {args.rows} patients")
+        start = time.perf_counter()
+        seed_patients(svc, args.rows)
+        print_info(f"Base prête en {time.perf_counter() - start:.1f}s ({db_path})")
+
+        client = svc.app.test_client()
+        results = []
+        for term in SEARCH_TERMS:
+            results.append((
+                term,
+                legacy_search(svc, term),
+                measure(lambda: legacy_search(svc, term), args.runs),
+                measure(lambda: client.get('/api/patients', query_string={'search': term}), args.runs),
+                measure(lambda: client.get('/api/patients/search', query_string={'q': term}), args.runs)
+            ))
+
+    print_header("Résultats (médiane en ms)")
+    print(f"{'Terme':<16}{'Résultats':>10}{'ILIKE':>12}{'Liste (index)':>16}{'/search':>10}")
+    for term, matches, legacy_ms, list_ms, search_ms in results:
+        print(f"{term:<16}{matches:>10}{legacy_ms:>12.1f}{list_ms:>16.1f}{search_ms:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,16 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func
 from datetime import datetime, timedelta
 import os
-import requests
+import threading
+from service_client import get_client, clients_stats
+from stats_cache import StatsCache
+from instrumentation import Instrumentation
+from jwt_auth import JWTAuth
+from pagination import cursor_requested, keyset_paginate, InvalidCursor
+from streaming_export import export_response, EXPORT_FORMATS
 
 app = Flask(__name__)
 CORS(app)
@@ -17,17 +24,51 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Cache des statistiques (vidé à chaque écriture)
+stats_cache = StatsCache(
+    ttl=float(os.getenv('STATS_CACHE_TTL', 5)),
+    max_size=int(os.getenv('STATS_CACHE_MAX_SIZE', 128))
+)
+stats_cache.init_app(app)
+
+# Mesures par requête (en-tête Server-Timing et endpoint /metrics)
+instrumentation = Instrumentation('appointment-service')
+instrumentation.init_app(app)
+
+# Vérification locale des jetons de l'auth-service (JWT_AUTH_MODE: off, optional, required)
+# La prise de rendez-vous reste ouverte aux patients sans compte
+jwt_auth = JWTAuth(public_routes=[('POST', '/api/appointments')])
+jwt_auth.init_app(app)
+
 # URLs des autres services
 PATIENT_SERVICE_URL = os.getenv('PATIENT_SERVICE_URL', 'http://localhost:5002')
 
+# Nombre d'IDs par appel à /api/patients/batch (MAX_BATCH_SIZE du patient-service)
+PATIENT_BATCH_SIZE = int(os.getenv('PATIENT_BATCH_SIZE', 500))
+
+# Taille maximale d'une page de /api/appointments (per_page)
+MAX_PER_PAGE = int(os.getenv('MAX_PER_PAGE', 100))
+
+# Intervalle (en secondes) de mise à jour automatique des rendez-vous passés
+PAST_APPOINTMENTS_INTERVAL = int(os.getenv('PAST_APPOINTMENTS_INTERVAL', 300))
+
+# Clients HTTP partagés (pool de connexions, timeouts, retries)
+patient_service = get_client(PATIENT_SERVICE_URL, name='patient-service')
+
 # ==================== MODELS ====================
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        # Liste filtrée par statut, triée par date / mise à jour des rendez-vous passés
+        db.Index('ix_appointments_status_date', 'status', 'appointment_date'),
+        # Rendez-vous d'un patient, triés par date
+        db.Index('ix_appointments_patient_date', 'patient_id', 'appointment_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, nullable=False)
     doctor_name = db.Column(db.String(100), nullable=False)
-    appointment_date = db.Column(db.DateTime, nullable=False)
+    appointment_date = db.Column(db.DateTime, nullable=False, index=True)
     duration = db.Column(db.Integer, default=30)  # en minutes
     status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled
     reason = db.Column(db.String(200))
@@ -52,7 +93,7 @@ class Appointment(db.Model):
 def get_patient_from_service(patient_id):
     """Récupérer les infos d'un patient depuis le patient-service"""
     try:
-        response = requests.get(f"{PATIENT_SERVICE_URL}/api/patients/{patient_id}")
+        response = patient_service.get(f"/api/patients/{patient_id}")
         if response.status_code == 200:
             data = response.json()
             return data.get('patient')
@@ -61,25 +102,47 @@ def get_patient_from_service(patient_id):
         print(f"Erreur lors de la récupération du patient: {e}")
         return None
 
+def get_patients_from_service(patient_ids):
+    """Récupérer plusieurs patients en un seul appel au patient-service
+
+    Retourne un dictionnaire {patient_id: patient}. Les IDs sont envoyés par
+    paquets de PATIENT_BATCH_SIZE (limite de /api/patients/batch).
+    """
+    patient_ids = sorted(set(patient_ids))
+    patients = {}
+    try:
+        for start in range(0, len(patient_ids), PATIENT_BATCH_SIZE):
+            chunk = patient_ids[start:start + PATIENT_BATCH_SIZE]
+            response = patient_service.get(
+                "/api/patients/batch",
+                params={'ids': ','.join(str(i) for i in chunk)}
+            )
+            if response.status_code == 200:
+                patients.update({p['id']: p for p in response.json().get('patients', [])})
+            else:
+                print(f"Erreur lors de la récupération des patients: HTTP {response.status_code}")
+    except Exception as e:
+        print(f"Erreur lors de la récupération des patients: {e}")
+    return patients
+
 def update_past_appointments():
     """Mettre à jour automatiquement le statut des rendez-vous passés"""
     try:
         now = datetime.utcnow()
 
-        # Mettre à jour les rendez-vous passés qui ne sont pas encore terminés ou annulés
-        past_appointments = Appointment.query.filter(
+        # Un seul UPDATE ensembliste, sans charger les rendez-vous en mémoire
+        # (ne met à jour que les rendez-vous planifiés)
+        updated_count = Appointment.query.filter(
             Appointment.appointment_date < now,
-            Appointment.status == 'scheduled'  # Ne mettre à jour que les rendez-vous planifiés
-        ).all()
-
-        updated_count = 0
-        for appointment in past_appointments:
-            appointment.status = 'completed'
-            appointment.updated_at = datetime.utcnow()
-            updated_count += 1
+            Appointment.status == 'scheduled'
+        ).update(
+            {Appointment.status: 'completed', Appointment.updated_at: now},
+            synchronize_session=False
+        )
+        db.session.commit()
 
         if updated_count > 0:
-            db.session.commit()
+            stats_cache.clear()
             print(f"✅ {updated_count} rendez-vous passés automatiquement marqués comme terminés")
 
         return updated_count
@@ -88,19 +151,66 @@ def update_past_appointments():
         db.session.rollback()
         return 0
 
+def create_missing_indexes():
+    """Créer sur une base existante les index déclarés dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les index manquants (CREATE INDEX, ignoré s'il existe déjà).
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def count_rows(model, *conditions):
+    """COUNT(*) en sous-requête scalaire: chaque compteur est calculé sur son propre index
+
+    Toutes les colonnes filtrées par les statistiques de ce service sont
+    indexées: plusieurs COUNT limités à l'index sont bien plus rapides qu'un
+    seul SUM(CASE ...) qui parcourt la table (voir scripts/benchmark_stats.py).
+    Les sous-requêtes sont réunies dans un seul SELECT (un aller-retour).
+    """
+    return db.select(func.count()).select_from(model).where(*conditions).scalar_subquery()
+
+def run_past_appointments_scheduler(stop_event):
+    """Boucle de fond: met à jour les rendez-vous passés à intervalle régulier"""
+    while True:
+        with app.app_context():
+            update_past_appointments()
+        if stop_event.wait(PAST_APPOINTMENTS_INTERVAL):
+            break
+
+def start_past_appointments_scheduler():
+    """Démarrer le thread de mise à jour des rendez-vous passés"""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_past_appointments_scheduler,
+        args=(stop_event,),
+        name='past-appointments-scheduler',
+        daemon=True
+    )
+    thread.start()
+    return stop_event
+
 # ==================== ROUTES ====================
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'appointment-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'appointment-service', 'auth': jwt_auth.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return instrumentation.metrics_response()
+
+@app.route('/health/upstreams', methods=['GET'])
+def upstreams_health():
+    """Métriques des appels vers les autres services"""
+    return jsonify({'success': True, 'upstreams': clients_stats()}), 200
 
 @app.route('/api/appointments', methods=['GET'])
 def get_appointments():
     """Récupérer tous les rendez-vous"""
     try:
-        # Mettre à jour automatiquement les rendez-vous passés avant de récupérer la liste
-        update_past_appointments()
-
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         status = request.args.get('status')
@@ -121,16 +231,22 @@ def get_appointments():
                 Appointment.appointment_date < next_day
             )
         
-        # Pagination
-        pagination = query.order_by(Appointment.appointment_date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, Appointment.appointment_date, Appointment.id)
+        else:
+            pagination = query.order_by(Appointment.appointment_date.desc()).paginate(
+                page=page, per_page=per_page, max_per_page=MAX_PER_PAGE, error_out=False
+            )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
         
-        # Enrichir avec les données patients
+        # Enrichir avec les données patients (un seul appel pour toute la page)
+        patients = get_patients_from_service(apt.patient_id for apt in items)
         appointments = []
-        for apt in pagination.items:
+        for apt in items:
             apt_dict = apt.to_dict()
-            patient = get_patient_from_service(apt.patient_id)
+            patient = patients.get(apt.patient_id)
             if patient:
                 apt_dict['patient'] = {
                     'name': f"{patient['first_name']} {patient['last_name']}",
@@ -142,14 +258,30 @@ def get_appointments():
         return jsonify({
             'success': True,
             'appointments': appointments,
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/appointments/export', methods=['GET'])
+def export_appointments():
+    """Exporter les rendez-vous en CSV ou NDJSON (streaming)"""
+    file_format = request.args.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'format doit être csv ou ndjson'}), 400
+    
+    query = Appointment.query
+    
+    # Filtrer par statut
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    
+    return export_response(query.order_by(Appointment.id), file_format, 'appointments')
+
 @app.route('/api/appointments/<int:appointment_id>', methods=['GET'])
 def get_appointment(appointment_id):
     """Récupérer un rendez-vous par ID"""
@@ -179,25 +311,19 @@ def create_appointment():
             if field not in data:
                 return jsonify({'success': False, 'error': f'{field} est requis'}), 400
 
-        # Vérifier si le patient existe via email
-        patient_res = requests.get(f"{PATIENT_SERVICE_URL}/api/patients?search={data['email']}")
-        if patient_res.status_code == 200 and patient_res.json().get('patients'):
-            patient = patient_res.json()['patients'][0]
-            patient_id = patient['id']
+        # Retrouver le patient par email exact, ou le créer s'il n'existe pas (un seul appel)
+        patient_res = patient_service.post("/api/patients/get-or-create", json={
+            'first_name': data['first_name'],
+            'last_name': data['last_name'],
+            'email': data['email'],
+            'phone': data.get('phone', ''),
+            'date_of_birth': data.get('date_of_birth', '1990-01-01'),
+            'gender': data.get('gender', 'Homme')
+        })
+        if patient_res.status_code in (200, 201) and patient_res.json().get('success'):
+            patient_id = patient_res.json()['patient']['id']
         else:
-            # Créer le patient si inexistant
-            new_patient_res = requests.post(f"{PATIENT_SERVICE_URL}/api/patients", json={
-                'first_name': data['first_name'],
-                'last_name': data['last_name'],
-                'email': data['email'],
-                'phone': data.get('phone', ''),
-                'date_of_birth': data.get('date_of_birth', '1990-01-01'),
-                'gender': data.get('gender', 'Homme')
-            })
-            if new_patient_res.status_code == 201 and new_patient_res.json().get('success'):
-                patient_id = new_patient_res.json()['patient']['id']
-            else:
-                return jsonify({'success': False, 'error': 'Impossible de créer le patient'}), 500
+            return jsonify({'success': False, 'error': 'Impossible de créer le patient'}), 500
 
         # Créer le rendez-vous
         # Handle both formats: with seconds and without seconds
@@ -281,6 +407,7 @@ def delete_appointment(appointment_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/appointments/stats', methods=['GET'])
+@stats_cache.cached_response
 def get_appointment_stats():
     """Obtenir les statistiques des rendez-vous"""
     try:
@@ -288,19 +415,14 @@ def get_appointment_stats():
         tomorrow = today + timedelta(days=1)
         week_later = today + timedelta(days=7)
         
-        total = Appointment.query.count()
-        today_count = Appointment.query.filter(
-            Appointment.appointment_date >= today,
-            Appointment.appointment_date < tomorrow
-        ).count()
-        
-        this_week = Appointment.query.filter(
-            Appointment.appointment_date >= today,
-            Appointment.appointment_date < week_later
-        ).count()
-        
-        completed = Appointment.query.filter_by(status='completed').count()
-        cancelled = Appointment.query.filter_by(status='cancelled').count()
+        # Un COUNT par index (appointment_date, status) dans une seule requête
+        total, today_count, this_week, completed, cancelled = db.session.query(
+            count_rows(Appointment),
+            count_rows(Appointment, Appointment.appointment_date >= today, Appointment.appointment_date < tomorrow),
+            count_rows(Appointment, Appointment.appointment_date >= today, Appointment.appointment_date < week_later),
+            count_rows(Appointment, Appointment.status == 'completed'),
+            count_rows(Appointment, Appointment.status == 'cancelled')
+        ).one()
         
         return jsonify({
             'success': True,
@@ -347,11 +469,29 @@ def manual_update_past_appointments():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CLI ====================
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Ajouter les index manquants à une base existante"""
+    create_missing_indexes()
+    print("✅ Index créés")
+
+@app.cli.command('update-past-appointments')
+def update_past_appointments_command():
+    """Mettre à jour les rendez-vous passés (à lancer via cron ou un worker dédié)"""
+    updated_count = update_past_appointments()
+    print(f"{updated_count} rendez-vous passés mis à jour")
+
 # ==================== MAIN ====================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_indexes()
         print("✅ Appointment Service: Database tables created successfully!")
     
+    # Avec le reloader de debug, ne démarrer le scheduler que dans le processus servant les requêtes
+    if PAST_APPOINTMENTS_INTERVAL > 0 and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_past_appointments_scheduler()
+    
     port = int(os.getenv('PORT', 5003))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -1,12 +1,21 @@
 # backend/services/auth-service/app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt, verify_jwt_in_request
+from sqlalchemy import func, case, inspect, text
 from datetime import datetime, timedelta
+import click
+from functools import wraps
 import os
 import re
+from stats_cache import StatsCache
+from instrumentation import Instrumentation
+from password_hashing import PasswordHasher, HashingBusy
+from batch_writer import BatchWriter, stop_on_sigterm
+from user_status import UserStatusCache
+from rate_limit import LoginRateLimiter
+from pagination import cursor_requested, keyset_paginate, InvalidCursor
 
 app = Flask(__name__)
 #CORS(app)
@@ -30,11 +39,67 @@ CORS(app, resources={
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///auth.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
+
+# Signature asymétrique (RS256/ES256) : les autres services vérifient les jetons
+# avec la clé publique seule (JWT_PUBLIC_KEY ou JWT_PUBLIC_KEY_FILE)
+app.config['JWT_ALGORITHM'] = os.getenv('JWT_ALGORITHM', 'HS256')
+if not app.config['JWT_ALGORITHM'].startswith('HS'):
+    if os.getenv('JWT_PRIVATE_KEY_FILE'):
+        with open(os.getenv('JWT_PRIVATE_KEY_FILE')) as f:
+            app.config['JWT_PRIVATE_KEY'] = f.read()
+    else:
+        app.config['JWT_PRIVATE_KEY'] = os.getenv('JWT_PRIVATE_KEY')
+    if os.getenv('JWT_PUBLIC_KEY_FILE'):
+        with open(os.getenv('JWT_PUBLIC_KEY_FILE')) as f:
+            app.config['JWT_PUBLIC_KEY'] = f.read()
+    else:
+        app.config['JWT_PUBLIC_KEY'] = os.getenv('JWT_PUBLIC_KEY')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
 
+@jwt.token_verification_loader
+def reject_service_tokens(jwt_header, jwt_data):
+    """Les jetons de service (flask issue-service-token) ne valent que
+    pour les appels entre services, pas pour les routes de l'auth-service"""
+    return jwt_data.get('role') != 'service'
+
+@jwt.token_verification_failed_loader
+def service_token_refused(jwt_header, jwt_data):
+    return jsonify({'success': False, 'error': 'Accès non autorisé'}), 403
+
+# Cache des statistiques (vidé à chaque écriture)
+stats_cache = StatsCache(
+    ttl=float(os.getenv('STATS_CACHE_TTL', 5)),
+    max_size=int(os.getenv('STATS_CACHE_MAX_SIZE', 128))
+)
+stats_cache.init_app(app)
+
+# Mesures par requête (en-tête Server-Timing et endpoint /metrics)
+instrumentation = Instrumentation('auth-service')
+instrumentation.init_app(app)
+
+# Hachage des mots de passe (PASSWORD_HASH_METHOD, pool de PASSWORD_HASH_WORKERS processus)
+password_hasher = PasswordHasher()
+
+# Limite des tentatives de connexion par IP et par identifiant, vérifiée avant
+# la lecture en base et le calcul du hash (LOGIN_RATE_LIMIT_IP,
+# LOGIN_RATE_LIMIT_USER; RATE_LIMIT_STORAGE_URL=redis://... pour partager les
+# compteurs entre workers)
+login_rate_limiter = LoginRateLimiter()
+
+# Écriture par lots de l'historique des connexions et du dernier login
+# (LOGIN_LOG_FLUSH_INTERVAL=0: écriture immédiate à chaque connexion)
+LOGIN_LOG_BATCH_SIZE = int(os.getenv('LOGIN_LOG_BATCH_SIZE', 200))
+LOGIN_LOG_FLUSH_INTERVAL = float(os.getenv('LOGIN_LOG_FLUSH_INTERVAL', 1))
+LOGIN_LOG_MAX_PENDING = int(os.getenv('LOGIN_LOG_MAX_PENDING', 10000))
+
+# Durée (en secondes) pendant laquelle le statut d'un utilisateur (actif, rôle,
+# version des jetons) est gardé en mémoire pour autoriser les requêtes
+USER_STATUS_TTL = float(os.getenv('USER_STATUS_TTL', 30))
+USER_STATUS_MAX_SIZE = int(os.getenv('USER_STATUS_MAX_SIZE', 10000))
+
 # ==================== MODELS ====================
 class User(db.Model):
     __tablename__ = 'users'
@@ -47,15 +112,41 @@ class User(db.Model):
     last_name = db.Column(db.String(50), nullable=False)
     role = db.Column(db.String(20), default='user')  # admin, doctor, nurse, user
     is_active = db.Column(db.Boolean, default=True)
+    token_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # Incrémenté pour révoquer les jetons
     last_login = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Liste triée par date de création (pagination par curseur sur (created_at, id))
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
+    
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def create_token(self):
+        """Créer un JWT portant le rôle et la version des jetons de l'utilisateur"""
+        return create_access_token(
+            identity=str(self.id),
+            additional_claims={
+                'role': self.role,
+                'email': self.email,
+                'username': self.username,
+                'ver': self.token_version or 0
+            }
+        )
+    
+    def revoke_tokens(self):
+        """Invalider tous les jetons déjà émis (appeler user_status.invalidate après le commit)"""
+        self.token_version = (self.token_version or 0) + 1
+    
+    def password_needs_rehash(self):
+        """Le hash a-t-il été calculé avec une méthode ou un coût différent de la configuration?"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
@@ -74,7 +165,7 @@ class LoginHistory(db.Model):
     __tablename__ = 'login_history'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     ip_address = db.Column(db.String(45))
     user_agent = db.Column(db.String(255))
     login_time = db.Column(db.DateTime, default=datetime.utcnow)
@@ -98,22 +189,145 @@ def validate_password(password):
         return False, "Le mot de passe doit contenir au moins un chiffre"
     return True, "OK"
 
-def log_login_attempt(user_id, ip_address, user_agent, success):
-    """Enregistrer une tentative de connexion"""
-    history = LoginHistory(
-        user_id=user_id,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        success=success
-    )
-    db.session.add(history)
+def create_missing_indexes():
+    """Créer sur une base existante les index déclarés dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les index manquants (CREATE INDEX, ignoré s'il existe déjà).
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def create_missing_columns():
+    """Ajouter sur une base existante les colonnes déclarées dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les colonnes manquantes (ALTER TABLE ... ADD COLUMN, avec leur
+    valeur par défaut côté serveur).
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            db.session.execute(text(ddl))
     db.session.commit()
 
+def count_where(*conditions):
+    """Compter les lignes vérifiant les conditions (SUM(CASE WHEN ... THEN 1 ELSE 0 END))"""
+    return func.coalesce(func.sum(case((db.and_(*conditions), 1), else_=0)), 0)
+
+def write_login_events(events):
+    """Écrire un lot de connexions: historique et dernier login, en une seule transaction"""
+    try:
+        db.session.execute(LoginHistory.__table__.insert(), events)
+        
+        # Dernier login de chaque utilisateur du lot (UPDATE groupé par clé primaire)
+        last_logins = {}
+        for event in events:
+            if event['success']:
+                last_logins[event['user_id']] = max(event['login_time'], last_logins.get(event['user_id'], event['login_time']))
+        if last_logins:
+            db.session.execute(
+                db.update(User),
+                [{'id': user_id, 'last_login': login_time} for user_id, login_time in last_logins.items()]
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def log_login_attempt(user_id, ip_address, user_agent, success, login_time=None):
+    """Enregistrer une tentative de connexion (et le dernier login si elle a réussi)
+
+    L'écriture est mise en file et faite par lots par login_writer.
+    """
+    login_writer.submit({
+        'user_id': user_id,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'login_time': login_time or datetime.utcnow(),
+        'success': success
+    })
+
+def load_user_status(user_id):
+    """Lire le statut d'un utilisateur (colonnes utiles à l'autorisation uniquement)"""
+    row = db.session.query(User.is_active, User.role, User.token_version).filter_by(id=user_id).first()
+    if row is None:
+        return None
+    return {'is_active': row.is_active, 'role': row.role, 'token_version': row.token_version or 0}
+
+user_status = UserStatusCache(load_user_status, ttl=USER_STATUS_TTL, max_size=USER_STATUS_MAX_SIZE)
+
+def current_user_id():
+    """ID de l'utilisateur du jeton (le sujet du JWT est une chaîne)"""
+    return int(get_jwt_identity())
+
+def claims_required(roles=None, check_status=True):
+    """Décorateur: JWT valide et rôle (claim signé `role`) parmi `roles`
+
+    Avec check_status, le compte doit être actif et la version des jetons
+    (claim `ver`) à jour: un compte désactivé, un rôle modifié ou des jetons
+    révoqués sont refusés. Le statut vient de user_status (cache mémoire),
+    pas d'une lecture de la table users à chaque appel.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            claims = get_jwt()
+            
+            if check_status:
+                status = user_status.get(current_user_id())
+                if status is None or not status['is_active'] or status['token_version'] != claims.get('ver', 0):
+                    return jsonify({'success': False, 'error': 'Token invalide'}), 401
+            
+            if roles and claims.get('role') not in roles:
+                return jsonify({'success': False, 'error': 'Accès non autorisé'}), 403
+            
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def too_many_login_attempts(retry_after):
+    """Réponse 429 d'une tentative de connexion refusée par login_rate_limiter"""
+    response = jsonify({
+        'success': False,
+        'error': f'Trop de tentatives de connexion, réessayez dans {retry_after} secondes'
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+login_writer = BatchWriter(
+    app,
+    write_login_events,
+    batch_size=LOGIN_LOG_BATCH_SIZE,
+    flush_interval=LOGIN_LOG_FLUSH_INTERVAL,
+    max_pending=LOGIN_LOG_MAX_PENDING,
+    name='login-history-writer'
+)
+stop_on_sigterm(login_writer)
+
 # ==================== ROUTES ====================
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'auth-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'auth-service', 'login_history': login_writer.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return Response(instrumentation.render() + login_rate_limiter.render('auth-service'),
+                    mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -157,10 +371,7 @@ def register():
         db.session.commit()
         
         # Créer le token
-        access_token = create_access_token(
-            identity=user.id,
-            additional_claims={'role': user.role, 'email': user.email}
-        )
+        access_token = user.create_token()
         
         return jsonify({
             'success': True,
@@ -169,6 +380,9 @@ def register():
             'access_token': access_token
         }), 201
         
+    except HashingBusy as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -182,12 +396,26 @@ def login():
         # Validation
         if not data.get('username') or not data.get('password'):
             return jsonify({'success': False, 'error': 'Username et password requis'}), 400
+        if not isinstance(data['username'], str) or not isinstance(data['password'], str):
+            return jsonify({'success': False, 'error': 'Username et password doivent être des chaînes de caractères'}), 400
+        
+        # Limiter les tentatives avant toute requête SQL ou calcul de hash
+        retry_after = login_rate_limiter.check(request.remote_addr, data['username'])
+        if retry_after is not None:
+            return too_many_login_attempts(retry_after)
         
         # Trouver l'utilisateur (par username ou email)
         user = User.query.filter(
             (User.username == data['username']) | (User.email == data['username'])
         ).first()
         
+        # Même budget pour un compte quel que soit l'identifiant saisi (username ou email),
+        # vérifié avant le calcul du hash
+        if user:
+            retry_after = login_rate_limiter.check_account(user.id)
+            if retry_after is not None:
+                return too_many_login_attempts(retry_after)
+        
         # Vérifier l'utilisateur et le mot de passe
         if not user or not user.check_password(data['password']):
             return jsonify({'success': False, 'error': 'Identifiants incorrects'}), 401
@@ -196,24 +424,23 @@ def login():
         if not user.is_active:
             return jsonify({'success': False, 'error': 'Compte désactivé'}), 403
         
-        # Mettre à jour le dernier login
-        user.last_login = datetime.utcnow()
-        db.session.commit()
+        # Connexion réussie: ne plus compter les échecs précédents sur ce compte,
+        # ni cette tentative sur l'adresse IP
+        login_rate_limiter.reset_user(data['username'], user.id, request.remote_addr)
         
-        # Enregistrer la tentative de connexion
+        # Recalculer le hash si la méthode ou le coût a changé
+        if user.password_needs_rehash():
+            user.set_password(data['password'])
+            db.session.commit()
+        
+        # Enregistrer la connexion et le dernier login (écriture différée, par lots)
+        user.last_login = datetime.utcnow()
         ip_address = request.remote_addr
         user_agent = request.headers.get('User-Agent', '')[:255]
-        log_login_attempt(user.id, ip_address, user_agent, True)
+        log_login_attempt(user.id, ip_address, user_agent, True, login_time=user.last_login)
         
         # Créer le token JWT
-        access_token = create_access_token(
-            identity=user.id,
-            additional_claims={
-                'role': user.role,
-                'email': user.email,
-                'username': user.username
-            }
-        )
+        access_token = user.create_token()
         
         return jsonify({
             'success': True,
@@ -222,6 +449,9 @@ def login():
             'access_token': access_token
         }), 200
         
+    except HashingBusy as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -230,8 +460,7 @@ def login():
 def get_current_user():
     """Récupérer les infos de l'utilisateur connecté"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = User.query.get(current_user_id())
         
         if not user:
             return jsonify({'success': False, 'error': 'Utilisateur non trouvé'}), 404
@@ -245,17 +474,10 @@ def get_current_user():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/auth/users', methods=['GET'])
-@jwt_required()
+@claims_required(roles=('admin',))
 def get_users():
     """Récupérer tous les utilisateurs (admin uniquement)"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        # Vérifier si l'utilisateur est admin
-        if current_user.role != 'admin':
-            return jsonify({'success': False, 'error': 'Accès non autorisé'}), 403
-        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         search = request.args.get('search', '')
@@ -278,32 +500,36 @@ def get_users():
         if role:
             query = query.filter_by(role=role)
         
-        # Pagination
-        pagination = query.order_by(User.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, User.created_at, User.id)
+        else:
+            pagination = query.order_by(User.created_at.desc()).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
         
         return jsonify({
             'success': True,
-            'users': [u.to_dict() for u in pagination.items],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            'users': [u.to_dict() for u in items],
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/auth/users/<int:user_id>', methods=['PUT'])
-@jwt_required()
+@claims_required()
 def update_user(user_id):
     """Mettre à jour un utilisateur"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        is_admin = get_jwt().get('role') == 'admin'
         
         # Vérifier les permissions (admin ou utilisateur lui-même)
-        if current_user.role != 'admin' and current_user_id != user_id:
+        if not is_admin and current_user_id() != user_id:
             return jsonify({'success': False, 'error': 'Accès non autorisé'}), 403
         
         user = User.query.get_or_404(user_id)
@@ -322,9 +548,14 @@ def update_user(user_id):
                 return jsonify({'success': False, 'error': 'Email déjà utilisé'}), 400
             user.email = data['email']
         
-        # Seul un admin peut changer le rôle
-        if 'role' in data and current_user.role == 'admin':
+        # Seul un admin peut changer le rôle ou (dés)activer un compte;
+        # les jetons déjà émis sont alors révoqués
+        if is_admin and 'role' in data and data['role'] != user.role:
             user.role = data['role']
+            user.revoke_tokens()
+        if is_admin and 'is_active' in data and bool(data['is_active']) != user.is_active:
+            user.is_active = bool(data['is_active'])
+            user.revoke_tokens()
         
         # Changer le mot de passe
         if 'password' in data:
@@ -332,9 +563,11 @@ def update_user(user_id):
             if not is_valid:
                 return jsonify({'success': False, 'error': message}), 400
             user.set_password(data['password'])
+            user.revoke_tokens()
         
         user.updated_at = datetime.utcnow()
         db.session.commit()
+        user_status.invalidate(user_id)
         
         return jsonify({
             'success': True,
@@ -342,29 +575,27 @@ def update_user(user_id):
             'user': user.to_dict()
         }), 200
         
+    except HashingBusy as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/auth/users/<int:user_id>', methods=['DELETE'])
-@jwt_required()
+@claims_required(roles=('admin',))
 def delete_user(user_id):
     """Supprimer un utilisateur (admin uniquement)"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if current_user.role != 'admin':
-            return jsonify({'success': False, 'error': 'Accès non autorisé'}), 403
-        
         user = User.query.get_or_404(user_id)
         
         # Empêcher la suppression de son propre compte
-        if user_id == current_user_id:
+        if user_id == current_user_id():
             return jsonify({'success': False, 'error': 'Vous ne pouvez pas supprimer votre propre compte'}), 400
         
         db.session.delete(user)
         db.session.commit()
+        user_status.invalidate(user_id)
         
         return jsonify({
             'success': True,
@@ -376,24 +607,30 @@ def delete_user(user_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/auth/stats', methods=['GET'])
-@jwt_required()
+@claims_required(roles=('admin',))
 def get_stats():
     """Statistiques utilisateurs"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if current_user.role != 'admin':
-            return jsonify({'success': False, 'error': 'Accès non autorisé'}), 403
-        
-        total_users = User.query.count()
-        active_users = User.query.filter_by(is_active=True).count()
-        admins = User.query.filter_by(role='admin').count()
-        doctors = User.query.filter_by(role='doctor').count()
+        return compute_user_stats()
         
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@stats_cache.cached_response
+def compute_user_stats():
+    """Calculer les statistiques utilisateurs (mises en cache, après contrôle d'accès)"""
+    try:
         # Nouveaux utilisateurs ce mois
         first_day = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        new_this_month = User.query.filter(User.created_at >= first_day).count()
+        
+        # Tous les compteurs en une seule passe sur la table
+        total_users, active_users, admins, doctors, new_this_month = db.session.query(
+            func.count(User.id),
+            count_where(User.is_active.is_(True)),
+            count_where(User.role == 'admin'),
+            count_where(User.role == 'doctor'),
+            count_where(User.created_at >= first_day)
+        ).one()
         
         return jsonify({
             'success': True,
@@ -410,25 +647,48 @@ def get_stats():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/auth/validate-token', methods=['GET'])
-@jwt_required()
+@claims_required()
 def validate_token():
-    """Valider un token JWT"""
+    """Valider un token JWT (signature, expiration, compte actif et jetons non révoqués)"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-
-        if not user or not user.is_active:
-            return jsonify({'success': False, 'error': 'Token invalide'}), 401
+        claims = get_jwt()
 
         return jsonify({
             'success': True,
             'valid': True,
-            'user': user.to_dict()
+            'user': {
+                'id': current_user_id(),
+                'username': claims.get('username'),
+                'email': claims.get('email'),
+                'role': claims.get('role')
+            }
         }), 200
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 401
 
+@app.route('/api/auth/users/<int:user_id>/revoke-tokens', methods=['POST'])
+@claims_required()
+def revoke_user_tokens(user_id):
+    """Révoquer tous les jetons d'un utilisateur (admin ou utilisateur lui-même)"""
+    try:
+        if get_jwt().get('role') != 'admin' and current_user_id() != user_id:
+            return jsonify({'success': False, 'error': 'Accès non autorisé'}), 403
+        
+        user = User.query.get_or_404(user_id)
+        user.revoke_tokens()
+        db.session.commit()
+        user_status.invalidate(user_id)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Jetons révoqués, une nouvelle connexion est nécessaire'
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/auth/forgot-password', methods=['POST'])
 def forgot_password():
     """Envoyer un email de réinitialisation de mot de passe"""
@@ -458,10 +718,32 @@ def forgot_password():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CLI ====================
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Ajouter les colonnes et index manquants à une base existante"""
+    create_missing_columns()
+    create_missing_indexes()
+    print("✅ Index créés")
+
+@app.cli.command('issue-service-token')
+@click.argument('service')
+@click.option('--days', default=365, show_default=True, help="Durée de validité en jours")
+def issue_service_token_command(service, days):
+    """Émettre le jeton SERVICE_TOKEN d'un service (appels entre services)"""
+    token = create_access_token(
+        identity=f'service:{service}',
+        additional_claims={'role': 'service', 'service': service},
+        expires_delta=timedelta(days=days)
+    )
+    print(token)
+
 # ==================== MAIN ====================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_columns()
+        create_missing_indexes()
         
         # Créer un admin par défaut s'il n'existe pas
         admin = User.query.filter_by(username='admin').first()
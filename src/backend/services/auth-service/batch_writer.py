@@ -0,0 +1,155 @@
+# Écritures différées par lots: les requêtes déposent leurs écritures dans
+# une file en mémoire, un thread de fond les écrit par lots (taille ou délai
+# atteint) dans une seule transaction.
+
+import atexit
+import queue
+import signal
+import threading
+import time
+
+_STOP = object()
+
+
+class BatchWriter:
+    """File d'écritures vidée par lots par un thread de fond
+
+    `write_batch(items)` est appelée (dans un contexte d'application) dès que
+    `batch_size` éléments sont en attente ou `flush_interval` secondes après
+    le premier élément du lot. La file est bornée à `max_pending` éléments:
+    quand elle est pleine, l'élément est écrit sur place plutôt que perdu.
+    Si l'écriture d'un lot échoue, ses éléments sont réécrits un par un: seuls
+    ceux qui échouent encore sont abandonnés (comptés dans `errors`). La file
+    est vidée à l'arrêt du processus (atexit, et SIGTERM via
+    `stop_on_sigterm`). Avec flush_interval=0, chaque élément est écrit
+    immédiatement (pas de thread).
+    """
+
+    def __init__(self, app, write_batch, batch_size=200, flush_interval=1.0, max_pending=10000, name='batch-writer'):
+        self.app = app
+        self.write_batch = write_batch
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.name = name
+        self._queue = queue.Queue(maxsize=max(max_pending, 1))
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.written = 0
+        self.overflows = 0
+        self.errors = 0
+
+    def submit(self, item):
+        """Ajouter une écriture à la file (ou l'écrire sur place si la file est pleine)"""
+        if self.flush_interval <= 0:
+            self._write([item])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.overflows += 1
+            self._write([item])
+
+    def flush(self):
+        """Attendre que toutes les écritures en file soient faites"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self, timeout=5):
+        """Écrire ce qui reste en file puis arrêter le thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'batches': self.batches,
+            'written': self.written,
+            'overflows': self.overflows,
+            'errors': self.errors
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            # Compléter le lot jusqu'à batch_size éléments ou flush_interval secondes
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            for _ in range(len(batch) + (1 if stopping else 0)):
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                self.write_batch(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                # Un élément invalide ne doit pas faire perdre le reste du lot
+                print(f"Erreur écriture différée ({self.name}, {len(batch)} éléments), réécriture un par un: {e}")
+                for item in batch:
+                    self._write([item])
+                return
+            self.errors += 1
+            print(f"Erreur écriture différée ({self.name}), élément abandonné: {e}")
+            return
+        self.batches += 1
+        self.written += len(batch)
+
+
+def stop_on_sigterm(*writers):
+    """Vider les files des writers à la réception de SIGTERM
+
+    `docker stop` envoie SIGTERM, pour lequel Python n'exécute pas les
+    fonctions atexit. Le gestionnaire précédent (celui de gunicorn par
+    exemple) est appelé ensuite; sans gestionnaire, le processus se termine.
+    Sans effet hors du thread principal, où un gestionnaire ne peut pas
+    être installé.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        for writer in writers:
+            writer.stop()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
@@ -0,0 +1,94 @@
+# Hachage des mots de passe: algorithme/coût configurables et calcul dans un
+# pool de processus borné, hors du thread qui traite la requête.
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Configuration (surchargeable par variables d'environnement)
+# Méthode werkzeug: "scrypt:N:r:p" ou "pbkdf2:sha256:itérations"
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', HASH_WORKERS * 4))
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+# Démarrage des processus du pool: jamais "fork", dangereux depuis un processus
+# multithreadé (verrous hérités dans un état incohérent)
+HASH_START_METHOD = os.getenv(
+    'PASSWORD_HASH_START_METHOD',
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+class HashingBusy(Exception):
+    """Trop de calculs de hachage en attente: la requête doit être refusée (503)"""
+
+
+class PasswordHasher:
+    """Hachage et vérification des mots de passe
+
+    Les calculs (volontairement coûteux en CPU) sont envoyés à un pool de
+    `workers` processus: le thread de la requête attend le résultat sans
+    occuper le GIL. Au plus `max_pending` calculs sont acceptés en même
+    temps (jusqu'à la fin effective du calcul); au-delà, ou si le résultat
+    n'arrive pas dans les `timeout` secondes, HashingBusy est levée au lieu
+    d'empiler les requêtes. Avec workers=0, le calcul est fait sur place.
+    """
+
+    def __init__(self, method=HASH_METHOD, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING,
+                 timeout=HASH_TIMEOUT, start_method=HASH_START_METHOD):
+        # Forme complète de la méthode (ex: "pbkdf2" -> "pbkdf2:sha256:1000000"),
+        # telle qu'elle apparaît en tête des hash générés
+        self.method = generate_password_hash('', method).split('$', 1)[0]
+        self.workers = workers
+        self.timeout = timeout
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+            return self._pool
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy('Service surchargé, réessayez plus tard')
+        try:
+            future = self._get_pool().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Le créneau reste pris jusqu'à la fin (ou l'annulation) du calcul, même
+        # si la requête a cessé d'attendre: max_pending borne le travail en cours
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingBusy('Service surchargé, réessayez plus tard')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Le hash a-t-il été calculé avec une autre méthode ou un autre coût?"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,250 @@
+# Limitation du nombre de tentatives de connexion par fenêtre glissante,
+# vérifiée avant tout calcul de hash (et, pour l'IP et l'identifiant saisi,
+# avant toute lecture en base).
+#
+# Chaque clé ("ip:<adresse>", "user:<identifiant>", "account:<id>") garde
+# l'horodatage de ses tentatives acceptées pendant la fenêtre; une connexion
+# réussie retire sa tentative de la fenêtre de l'IP, qui ne compte donc que
+# les échecs (un cabinet derrière une seule adresse NAT n'est pas bloqué par
+# ses connexions normales). Stockage:
+# - en mémoire (défaut, RATE_LIMIT_STORAGE_URL=memory://): propre à chaque
+#   processus, la limite effective est donc multipliée par le nombre de
+#   workers;
+# - Redis (RATE_LIMIT_STORAGE_URL=redis://hôte:6379/0, le paquet redis doit
+#   être installé): compteurs partagés entre workers et instances.
+
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# Configuration (surchargeable par variables d'environnement)
+# Règles "tentatives/secondes"; "0" désactive la règle
+LOGIN_RATE_LIMIT_IP = os.getenv('LOGIN_RATE_LIMIT_IP', '20/60')
+LOGIN_RATE_LIMIT_USER = os.getenv('LOGIN_RATE_LIMIT_USER', '10/300')
+STORAGE_URL = os.getenv('RATE_LIMIT_STORAGE_URL', 'memory://')
+MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+
+
+def parse_rule(rule):
+    """"20/60" -> (20, 60.0); None si la règle est vide ou désactivée"""
+    if not rule or rule.strip() == '0':
+        return None
+    limit, _, window = rule.partition('/')
+    limit, window = int(limit), float(window or 60)
+    if limit <= 0 or window <= 0:
+        return None
+    return limit, window
+
+
+class MemoryWindowStore:
+    """Fenêtres glissantes en mémoire du processus
+
+    Au-delà de `max_keys` clés, la moins récemment utilisée est évincée (ses
+    tentatives sont oubliées) pour borner la mémoire face à des adresses ou
+    identifiants tous différents.
+    """
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        """Enregistrer une tentative si la limite le permet
+
+        Retourne (acceptée, secondes avant la prochaine tentative possible).
+        """
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._windows.get(key)
+            if attempts is None:
+                attempts = self._windows[key] = deque()
+            self._windows.move_to_end(key)
+            while attempts and attempts[0] <= now - window:
+                attempts.popleft()
+
+            if len(attempts) >= limit:
+                return False, attempts[0] + window - now
+
+            attempts.append(now)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+            return True, 0.0
+
+    def release(self, key):
+        """Retirer la dernière tentative enregistrée sur la clé"""
+        with self._lock:
+            attempts = self._windows.get(key)
+            if attempts:
+                attempts.pop()
+
+    def reset(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+
+# Nettoyage, comptage et ajout dans une seule opération atomique côté Redis
+_REDIS_HIT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('EXPIRE', KEYS[1], math.ceil(window))
+    return {1, '0'}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, tostring(tonumber(oldest[2]) + window - now)}
+"""
+
+
+class RedisWindowStore:
+    """Fenêtres glissantes partagées dans Redis (un sorted set par clé)"""
+
+    def __init__(self, url, prefix='login-rate:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(f"Stockage {url} indisponible: paquet redis non installé")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._hit = self.client.register_script(_REDIS_HIT)
+
+    def hit(self, key, limit, window):
+        allowed, retry_after = self._hit(
+            keys=[self.prefix + key],
+            args=[time.time(), window, limit, uuid.uuid4().hex]
+        )
+        return bool(allowed), float(retry_after)
+
+    def release(self, key):
+        self.client.zpopmax(self.prefix + key)
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+def create_store(url=STORAGE_URL):
+    if url.startswith('memory://'):
+        return MemoryWindowStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisWindowStore(url)
+    raise RuntimeError(f"RATE_LIMIT_STORAGE_URL non supportée: {url}")
+
+
+class LoginRateLimiter:
+    """Limite des tentatives de connexion par adresse IP et par compte
+
+    `check(ip, username)` enregistre la tentative sur les fenêtres de l'IP
+    et de l'identifiant saisi, avant toute lecture en base.
+    `check_account(user_id)` l'enregistre sur la fenêtre du compte trouvé,
+    avant la vérification du mot de passe, pour que "bob" et "bob@x.com"
+    partagent le même budget. Les deux retournent None si la tentative est acceptée,
+    sinon le nombre entier de secondes à attendre (réponse 429 et en-tête
+    Retry-After). Une connexion réussie (`reset_user`) remet à zéro les
+    compteurs de l'identifiant et du compte et retire sa tentative de la
+    fenêtre de l'IP, pour ne freiner que les échecs répétés. Si
+    le stockage est injoignable, la tentative est acceptée (l'erreur est
+    comptée).
+    """
+
+    SCOPES = ('ip', 'user', 'account')
+
+    def __init__(self, store=None, ip_rule=LOGIN_RATE_LIMIT_IP, user_rule=LOGIN_RATE_LIMIT_USER):
+        self.store = store if store is not None else create_store()
+        user_rule = parse_rule(user_rule)
+        self.rules = {'ip': parse_rule(ip_rule), 'user': user_rule, 'account': user_rule}
+        self._lock = threading.Lock()
+        self.allowed = dict.fromkeys(self.SCOPES, 0)
+        self.rejected = dict.fromkeys(self.SCOPES, 0)
+        self.errors = 0
+
+    @staticmethod
+    def user_key(username):
+        return f'user:{username.strip().lower()}'
+
+    @staticmethod
+    def account_key(user_id):
+        return f'account:{user_id}'
+
+    def check(self, ip_address, username):
+        return self._hit(('ip', f'ip:{ip_address}'), ('user', self.user_key(username)))
+
+    def check_account(self, user_id):
+        return self._hit(('account', self.account_key(user_id)))
+
+    def _hit(self, *windows):
+        for scope, key in windows:
+            rule = self.rules[scope]
+            if rule is None:
+                continue
+            try:
+                allowed, retry_after = self.store.hit(key, *rule)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"Erreur limitation des connexions ({key}): {e}")
+                continue
+            with self._lock:
+                if allowed:
+                    self.allowed[scope] += 1
+                else:
+                    self.rejected[scope] += 1
+            if not allowed:
+                return max(math.ceil(retry_after), 1)
+        return None
+
+    def reset_user(self, username, user_id, ip_address=None):
+        operations = []
+        if self.rules['ip'] is not None and ip_address is not None:
+            operations.append((self.store.release, f'ip:{ip_address}'))
+        if self.rules['user'] is not None:
+            operations += [(self.store.reset, self.user_key(username)), (self.store.reset, self.account_key(user_id))]
+        for operation, key in operations:
+            try:
+                operation(key)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"Erreur limitation des connexions (remise à zéro {key}): {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'storage': type(self.store).__name__,
+                'rules': {scope: rule and f'{rule[0]}/{rule[1]:g}' for scope, rule in self.rules.items()},
+                'allowed': dict(self.allowed),
+                'rejected': dict(self.rejected),
+                'errors': self.errors
+            }
+
+    def render(self, service):
+        """Compteurs au format d'exposition texte de Prometheus"""
+        stats = self.stats()
+        lines = []
+        for name, field, help_text in (
+            ('login_rate_limit_allowed_total', 'allowed', 'Tentatives de connexion acceptées par la limite'),
+            ('login_rate_limit_rejected_total', 'rejected', 'Tentatives de connexion refusées (429)'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for scope, count in sorted(stats[field].items()):
+                lines.append(f'{name}{{service="{service}",scope="{scope}"}} {count}')
+        lines += [
+            '# HELP login_rate_limit_errors_total Erreurs du stockage de la limite (tentatives acceptées)',
+            '# TYPE login_rate_limit_errors_total counter',
+            f'login_rate_limit_errors_total{{service="{service}"}} {stats["errors"]}'
+        ]
+        return '\n'.join(lines) + '\n'
+
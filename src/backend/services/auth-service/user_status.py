@@ -0,0 +1,54 @@
+# Cache en mémoire du statut des utilisateurs (actif, rôle, version des jetons)
+# pour autoriser les requêtes à partir des claims du JWT sans lire la table
+# users à chaque appel.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserStatusCache:
+    """Statut des utilisateurs par ID, lu via `load(user_id)` puis gardé `ttl` secondes
+
+    `load` retourne un dict {is_active, role, token_version} ou None si
+    l'utilisateur n'existe plus (ce résultat est aussi mis en cache). Au-delà
+    de `max_size` entrées, la moins récemment lue est évincée. Les écritures
+    faites par ce processus appellent `invalidate`; les autres processus voient
+    le changement au plus tard après `ttl` secondes.
+    """
+
+    def __init__(self, load, ttl=30, max_size=10000):
+        self.load = load
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        if self.ttl > 0:
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return entry[0]
+
+        status = self.load(user_id)
+        with self._lock:
+            self.misses += 1
+            if self.ttl > 0:
+                self._entries[user_id] = (status, time.monotonic())
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return status
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
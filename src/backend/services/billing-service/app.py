@@ -2,9 +2,15 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func, case
 from datetime import datetime
 import os
-import requests
+from service_client import get_client, clients_stats
+from stats_cache import StatsCache
+from instrumentation import Instrumentation
+from jwt_auth import JWTAuth
+from pagination import cursor_requested, keyset_paginate, InvalidCursor
+from streaming_export import export_response, EXPORT_FORMATS
 
 app = Flask(__name__)
 CORS(app)
@@ -15,14 +21,37 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Cache des statistiques (vidé à chaque écriture)
+stats_cache = StatsCache(
+    ttl=float(os.getenv('STATS_CACHE_TTL', 5)),
+    max_size=int(os.getenv('STATS_CACHE_MAX_SIZE', 128))
+)
+stats_cache.init_app(app)
+
+# Mesures par requête (en-tête Server-Timing et endpoint /metrics)
+instrumentation = Instrumentation('billing-service')
+instrumentation.init_app(app)
+
+# Vérification locale des jetons de l'auth-service (JWT_AUTH_MODE: off, optional, required)
+jwt_auth = JWTAuth()
+jwt_auth.init_app(app)
+
 # URLs des autres services
 APPOINTMENT_SERVICE_URL = os.getenv('APPOINTMENT_SERVICE_URL', 'http://localhost:5003')
 PATIENT_SERVICE_URL = os.getenv('PATIENT_SERVICE_URL', 'http://localhost:5002')
 DOCTOR_SERVICE_URL = os.getenv('DOCTOR_SERVICE_URL', 'http://localhost:5006')
 
+# Clients HTTP partagés (pool de connexions, timeouts, retries)
+doctor_service = get_client(DOCTOR_SERVICE_URL, name='doctor-service')
+
 # ==================== MODELS ====================
 class Invoice(db.Model):
     __tablename__ = 'invoices'
+    __table_args__ = (
+        # Factures filtrées par statut ou par patient, triées par date
+        db.Index('ix_invoices_status_date', 'status', 'invoice_date'),
+        db.Index('ix_invoices_patient_date', 'patient_id', 'invoice_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     consultation_id = db.Column(db.Integer, nullable=False)  # ID du rendez-vous
@@ -44,7 +73,7 @@ class Invoice(db.Model):
     payment_method = db.Column(db.String(50))  # cash, card, insurance, etc.
     
     # Dates
-    invoice_date = db.Column(db.DateTime, default=datetime.utcnow)
+    invoice_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     payment_date = db.Column(db.DateTime)
     due_date = db.Column(db.DateTime)
     
@@ -73,6 +102,10 @@ class Invoice(db.Model):
 
 class BMIRecord(db.Model):
     __tablename__ = 'bmi_records'
+    __table_args__ = (
+        # Mesures d'un patient, triées par date
+        db.Index('ix_bmi_records_patient_date', 'patient_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, nullable=False)
@@ -125,10 +158,24 @@ def calculate_bmi(weight, height_cm):
     
     return round(bmi, 2), category
 
+def create_missing_indexes():
+    """Créer sur une base existante les index déclarés dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les index manquants (CREATE INDEX, ignoré s'il existe déjà).
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def count_where(*conditions):
+    """Compter les lignes vérifiant les conditions (SUM(CASE WHEN ... THEN 1 ELSE 0 END))"""
+    return func.coalesce(func.sum(case((db.and_(*conditions), 1), else_=0)), 0)
+
 def get_doctor_fee(doctor_id):
     """Récupérer les frais de consultation du médecin"""
     try:
-        response = requests.get(f"{DOCTOR_SERVICE_URL}/api/doctors/{doctor_id}")
+        response = doctor_service.get(f"/api/doctors/{doctor_id}")
         if response.status_code == 200:
             doctor = response.json().get('doctor')
             return doctor.get('consultation_fee', 50.0)
@@ -140,7 +187,17 @@ def get_doctor_fee(doctor_id):
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'billing-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'billing-service', 'auth': jwt_auth.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return instrumentation.metrics_response()
+
+@app.route('/health/upstreams', methods=['GET'])
+def upstreams_health():
+    """Métriques des appels vers les autres services"""
+    return jsonify({'success': True, 'upstreams': clients_stats()}), 200
 
 @app.route('/api/invoices', methods=['GET'])
 def get_invoices():
@@ -158,21 +215,45 @@ def get_invoices():
         if patient_id:
             query = query.filter_by(patient_id=patient_id)
         
-        pagination = query.order_by(Invoice.invoice_date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, Invoice.invoice_date, Invoice.id)
+        else:
+            pagination = query.order_by(Invoice.invoice_date.desc()).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
         
         return jsonify({
             'success': True,
-            'invoices': [i.to_dict() for i in pagination.items],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            'invoices': [i.to_dict() for i in items],
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/invoices/export', methods=['GET'])
+def export_invoices():
+    """Exporter les factures en CSV ou NDJSON (streaming)"""
+    file_format = request.args.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'format doit être csv ou ndjson'}), 400
+    
+    status = request.args.get('status')
+    patient_id = request.args.get('patient_id', type=int)
+    
+    query = Invoice.query
+    if status:
+        query = query.filter_by(status=status)
+    if patient_id:
+        query = query.filter_by(patient_id=patient_id)
+    
+    return export_response(query.order_by(Invoice.id), file_format, 'invoices')
+
 @app.route('/api/invoices/<int:invoice_id>', methods=['GET'])
 def get_invoice(invoice_id):
     """Récupérer une facture"""
@@ -280,16 +361,20 @@ def delete_invoice(invoice_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/invoices/stats', methods=['GET'])
+@stats_cache.cached_response
 def get_invoice_stats():
     """Statistiques des factures"""
     try:
-        total_invoices = Invoice.query.count()
-        pending = Invoice.query.filter_by(status='pending').count()
-        paid = Invoice.query.filter_by(status='paid').count()
-        
-        from sqlalchemy import func
-        total_revenue = db.session.query(func.sum(Invoice.montant_total)).filter_by(status='paid').scalar() or 0
-        total_pending = db.session.query(func.sum(Invoice.reste_a_payer)).filter_by(status='pending').scalar() or 0
+        # Compteurs et montants en une seule passe sur la table
+        total_invoices, pending, paid, total_revenue, total_pending = db.session.query(
+            func.count(Invoice.id),
+            count_where(Invoice.status == 'pending'),
+            count_where(Invoice.status == 'paid'),
+            func.sum(case((Invoice.status == 'paid', Invoice.montant_total), else_=0)),
+            func.sum(case((Invoice.status == 'pending', Invoice.reste_a_payer), else_=0))
+        ).one()
+        total_revenue = total_revenue or 0
+        total_pending = total_pending or 0
         
         return jsonify({
             'success': True,
@@ -382,10 +467,18 @@ def delete_bmi_record(record_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CLI ====================
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Ajouter les index manquants à une base existante"""
+    create_missing_indexes()
+    print("✅ Index créés")
+
 # ==================== MAIN ====================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_indexes()
         print("✅ Billing Service: Database tables created successfully!")
     
     port = int(os.getenv('PORT', 5007))
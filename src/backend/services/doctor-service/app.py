@@ -2,8 +2,13 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func, case
 from datetime import datetime
 import os
+from stats_cache import StatsCache
+from instrumentation import Instrumentation
+from jwt_auth import JWTAuth
+from pagination import cursor_requested, keyset_paginate, InvalidCursor
 
 app = Flask(__name__)
 CORS(app)
@@ -15,6 +20,22 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Cache des statistiques (vidé à chaque écriture)
+stats_cache = StatsCache(
+    ttl=float(os.getenv('STATS_CACHE_TTL', 5)),
+    max_size=int(os.getenv('STATS_CACHE_MAX_SIZE', 128))
+)
+stats_cache.init_app(app)
+
+# Mesures par requête (en-tête Server-Timing et endpoint /metrics)
+instrumentation = Instrumentation('doctor-service')
+instrumentation.init_app(app)
+
+# Vérification locale des jetons de l'auth-service (JWT_AUTH_MODE: off, optional, required)
+# La liste des médecins est affichée sur les pages publiques (accueil, rendez-vous)
+jwt_auth = JWTAuth(public_routes=[('GET', '/api/doctors')])
+jwt_auth.init_app(app)
+
 # ==================== MODELS ====================
 class Doctor(db.Model):
     __tablename__ = 'doctors'
@@ -50,6 +71,11 @@ class Doctor(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Liste triée par nom (pagination par curseur sur (last_name, id))
+        db.Index('ix_doctors_last_name_id', 'last_name', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -90,11 +116,31 @@ class Specialization(db.Model):
             'description': self.description
         }
 
+# ==================== HELPER FUNCTIONS ====================
+def create_missing_indexes():
+    """Créer sur une base existante les index déclarés dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les index manquants (CREATE INDEX, ignoré s'il existe déjà).
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def count_where(*conditions):
+    """Compter les lignes vérifiant les conditions (SUM(CASE WHEN ... THEN 1 ELSE 0 END))"""
+    return func.coalesce(func.sum(case((db.and_(*conditions), 1), else_=0)), 0)
+
 # ==================== ROUTES ====================
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'doctor-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'doctor-service', 'auth': jwt_auth.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return instrumentation.metrics_response()
 
 @app.route('/api/doctors', methods=['GET'])
 def get_doctors():
@@ -132,19 +178,24 @@ def get_doctors():
         if city:
             query = query.filter_by(city=city)
         
-        # Pagination
-        pagination = query.order_by(Doctor.last_name).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, Doctor.last_name, Doctor.id, descending=False)
+        else:
+            pagination = query.order_by(Doctor.last_name).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
         
         return jsonify({
             'success': True,
-            'doctors': [d.to_dict() for d in pagination.items],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            'doctors': [d.to_dict() for d in items],
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -294,15 +345,22 @@ def toggle_doctor_status(doctor_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/doctors/stats', methods=['GET'])
+@stats_cache.cached_response
 def get_doctor_stats():
     """Obtenir les statistiques des médecins"""
     try:
-        total = Doctor.query.count()
-        active = Doctor.query.filter_by(is_active=True).count()
-        inactive = Doctor.query.filter_by(is_active=False).count()
+        # Nouveaux médecins ce mois
+        first_day = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        
+        # Tous les compteurs en une seule passe sur la table
+        total, active, inactive, new_this_month = db.session.query(
+            func.count(Doctor.id),
+            count_where(Doctor.is_active.is_(True)),
+            count_where(Doctor.is_active.is_(False)),
+            count_where(Doctor.created_at >= first_day)
+        ).one()
         
         # Médecins par spécialisation
-        from sqlalchemy import func
         specializations = db.session.query(
             Doctor.specialization,
             func.count(Doctor.id).label('count')
@@ -319,10 +377,6 @@ def get_doctor_stats():
          .order_by(func.count(Doctor.id).desc())\
          .limit(5).all()
         
-        # Nouveaux médecins ce mois
-        first_day = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        new_this_month = Doctor.query.filter(Doctor.created_at >= first_day).count()
-        
         return jsonify({
             'success': True,
             'stats': {
@@ -413,10 +467,18 @@ def get_available_doctors():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CLI ====================
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Ajouter les index manquants à une base existante"""
+    create_missing_indexes()
+    print("✅ Index créés")
+
 # ==================== MAIN ====================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_indexes()
         
         # Créer des spécialisations par défaut
         default_specializations = [
@@ -0,0 +1,95 @@
+# Cache en mémoire (TTL + taille bornée) des réponses de statistiques.
+# Fichier identique dans chaque service (chaque image Docker est construite
+# à partir du dossier du service).
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+class StatsCache:
+    """Cache des réponses JSON des endpoints de statistiques
+
+    Les entrées expirent après `ttl` secondes; au-delà de `max_size` entrées,
+    la plus ancienne est évincée. Tout le cache est vidé dès que le service
+    traite une écriture (POST/PUT/PATCH/DELETE réussie) via `init_app`.
+    """
+
+    def __init__(self, ttl=5, max_size=128):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """Vider le cache après chaque requête d'écriture réussie"""
+        @app.after_request
+        def invalidate_stats_cache(response):
+            if request.method in WRITE_METHODS and response.status_code < 400:
+                self.clear()
+            return response
+
+    def get(self, key):
+        """Retourner (valeur, âge en secondes) ou None si absent/expiré
+
+        Compte le succès ou l'échec (`hits`, `misses`) sous le verrou du cache.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age >= self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value, age
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached_response(self, view):
+        """Décorateur: mettre en cache la réponse (200) d'une vue Flask
+
+        Ajoute les en-têtes `X-Cache` (HIT/MISS) et `Age` à la réponse.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.ttl <= 0:
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            cached = self.get(key)
+            if cached is not None:
+                (body, mimetype), age = cached
+                response = current_app.response_class(body, status=200, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                response.headers['Age'] = str(int(age))
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                self.set(key, (response.get_data(), response.mimetype))
+            response.headers['X-Cache'] = 'MISS'
+            response.headers['Age'] = '0'
+            return response
+
+        return wrapper
@@ -2,8 +2,16 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func, case, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
 import os
+import threading
+from stats_cache import StatsCache
+from instrumentation import Instrumentation
+from jwt_auth import JWTAuth
+from pagination import cursor_requested, keyset_paginate, InvalidCursor
 
 app = Flask(__name__)
 CORS(app)
@@ -15,6 +23,32 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Cache des statistiques (vidé à chaque écriture)
+stats_cache = StatsCache(
+    ttl=float(os.getenv('STATS_CACHE_TTL', 5)),
+    max_size=int(os.getenv('STATS_CACHE_MAX_SIZE', 128))
+)
+stats_cache.init_app(app)
+
+# Mesures par requête (en-tête Server-Timing et endpoint /metrics)
+instrumentation = Instrumentation('medicine-service')
+instrumentation.init_app(app)
+
+# Vérification locale des jetons de l'auth-service (JWT_AUTH_MODE: off, optional, required)
+jwt_auth = JWTAuth()
+jwt_auth.init_app(app)
+
+# Nombre maximum d'IDs (ou de transactions) acceptés par /api/medicines/batch et /api/medicines/stock/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 500))
+
+# Durée de validité par défaut (en heures) d'une réservation de stock
+RESERVATION_TTL_HOURS = float(os.getenv('RESERVATION_TTL_HOURS', 72))
+# Durée maximale (en heures) acceptée pour ttl_hours
+MAX_RESERVATION_TTL_HOURS = float(os.getenv('MAX_RESERVATION_TTL_HOURS', 720))
+
+# Intervalle (en secondes) de libération des réservations expirées
+RESERVATION_SWEEP_INTERVAL = int(os.getenv('RESERVATION_SWEEP_INTERVAL', 300))
+
 # ==================== MODELS ====================
 class Medicine(db.Model):
     __tablename__ = 'medicines'
@@ -30,6 +64,7 @@ class Medicine(db.Model):
     
     # Gestion du stock
     stock_quantity = db.Column(db.Integer, default=0)
+    reserved_quantity = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # Réservé par des ordonnances
     min_stock_level = db.Column(db.Integer, default=10)
     unit_price = db.Column(db.Float, default=0.0)
     
@@ -40,7 +75,7 @@ class Medicine(db.Model):
     # Dates
     expiry_date = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relation avec l'historique
     stock_history = db.relationship('StockHistory', backref='medicine', cascade='all, delete-orphan')
@@ -56,6 +91,8 @@ class Medicine(db.Model):
             'dosage_form': self.dosage_form,
             'strength': self.strength,
             'stock_quantity': self.stock_quantity,
+            'reserved_quantity': self.reserved_quantity,
+            'available_quantity': self.stock_quantity - (self.reserved_quantity or 0),
             'min_stock_level': self.min_stock_level,
             'unit_price': self.unit_price,
             'requires_prescription': self.requires_prescription,
@@ -81,6 +118,10 @@ class Medicine(db.Model):
 
 class StockHistory(db.Model):
     __tablename__ = 'stock_history'
+    __table_args__ = (
+        # Historique d'un médicament, trié par date
+        db.Index('ix_stock_history_medicine_date', 'medicine_id', 'transaction_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
@@ -104,6 +145,56 @@ class StockHistory(db.Model):
             'user': self.user
         }
 
+class StockReservation(db.Model):
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        # Réservations actives arrivées à expiration
+        db.Index('ix_stock_reservations_status_expires', 'status', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reference = db.Column(db.String(100), unique=True, nullable=False)  # ex: "prescription-42"
+    status = db.Column(db.String(20), default='active', nullable=False)  # active, consumed, released, expired
+    expires_at = db.Column(db.DateTime, nullable=False)
+    user = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    items = db.relationship('StockReservationItem', backref='reservation', cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'reference': self.reference,
+            'status': self.status,
+            'expires_at': self.expires_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'user': self.user,
+            'items': [i.to_dict() for i in self.items],
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+class StockReservationItem(db.Model):
+    __tablename__ = 'stock_reservation_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reservation_id = db.Column(db.Integer, db.ForeignKey('stock_reservations.id'), nullable=False, index=True)
+    medicine_id = db.Column(db.Integer, nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'medicine_id': self.medicine_id,
+            'quantity': self.quantity
+        }
+
+class DeletedMedicine(db.Model):
+    """Trace d'un médicament supprimé, pour le flux /api/medicines/changes"""
+    __tablename__ = 'deleted_medicines'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
 class MedicineCategory(db.Model):
     __tablename__ = 'medicine_categories'
     
@@ -119,24 +210,117 @@ class MedicineCategory(db.Model):
         }
 
 # ==================== HELPER FUNCTIONS ====================
-def record_stock_transaction(medicine_id, transaction_type, quantity, notes=None, user=None):
-    """Enregistrer une transaction de stock"""
-    medicine = Medicine.query.get(medicine_id)
-    if not medicine:
-        return False
-    
-    previous_qty = medicine.stock_quantity
-    
-    # Calculer la nouvelle quantité
-    if transaction_type in ['purchase', 'adjustment_increase']:
-        new_qty = previous_qty + quantity
-    elif transaction_type in ['sale', 'expired', 'adjustment_decrease']:
-        new_qty = previous_qty - quantity
-    else:
-        new_qty = previous_qty
-    
-    # Créer l'historique
-    history = StockHistory(
+def create_missing_indexes():
+    """Créer sur une base existante les index déclarés dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les index manquants (CREATE INDEX, ignoré s'il existe déjà).
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def create_missing_columns():
+    """Ajouter sur une base existante les colonnes déclarées dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les colonnes manquantes (ALTER TABLE ... ADD COLUMN, avec leur
+    valeur par défaut côté serveur).
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            db.session.execute(text(ddl))
+    db.session.commit()
+
+def count_where(*conditions):
+    """Compter les lignes vérifiant les conditions (SUM(CASE WHEN ... THEN 1 ELSE 0 END))"""
+    return func.coalesce(func.sum(case((db.and_(*conditions), 1), else_=0)), 0)
+
+# Effet de chaque type de transaction sur le stock
+STOCK_INCREASE_TYPES = ('purchase', 'adjustment_increase')
+STOCK_DECREASE_TYPES = ('sale', 'expired', 'adjustment_decrease')
+STOCK_TRANSACTION_TYPES = STOCK_INCREASE_TYPES + STOCK_DECREASE_TYPES
+
+class InsufficientStock(Exception):
+    """Sortie de stock supérieure à la quantité disponible"""
+
+    def __init__(self, medicine_id, requested, available):
+        super().__init__(
+            f"Stock insuffisant pour le médicament {medicine_id}: "
+            f"{requested} demandé(s), {available} disponible(s)"
+        )
+        self.medicine_id = medicine_id
+        self.requested = requested
+        self.available = available
+
+def change_stock(medicine_id, stock_delta=0, reserved_delta=0, required=0):
+    """Modifier le stock et/ou la quantité réservée dans la transaction SQL courante
+
+    Le stock est modifié par un UPDATE atomique (stock_quantity = stock_quantity ± q)
+    et la nouvelle valeur est relue par RETURNING: deux transactions concurrentes
+    ne peuvent pas écraser la mise à jour l'une de l'autre. Si `required` > 0,
+    l'UPDATE n'a lieu que si le stock disponible (stock_quantity - reserved_quantity)
+    couvre cette quantité: une sortie ne peut pas entamer le stock réservé.
+
+    Retourne (quantité précédente, nouvelle quantité), ou None si le
+    médicament n'existe pas. Lève InsufficientStock si le stock disponible
+    est inférieur à `required`.
+    """
+    statement = db.update(Medicine).where(Medicine.id == medicine_id)
+    if required > 0:
+        statement = statement.where(Medicine.stock_quantity - Medicine.reserved_quantity >= required)
+    statement = statement.values(
+        stock_quantity=Medicine.stock_quantity + stock_delta,
+        reserved_quantity=Medicine.reserved_quantity + reserved_delta,
+        updated_at=datetime.utcnow()
+    ).returning(Medicine.stock_quantity)
+
+    new_qty = db.session.execute(statement).scalar()
+    if new_qty is None:
+        available = db.session.query(
+            Medicine.stock_quantity - Medicine.reserved_quantity
+        ).filter_by(id=medicine_id).scalar()
+        if available is None:
+            return None
+        raise InsufficientStock(medicine_id, required, available)
+    return new_qty - stock_delta, new_qty
+
+def update_stock_quantity(medicine_id, transaction_type, quantity):
+    """Appliquer l'effet d'un type de transaction sur le stock (sans commit ni historique)
+
+    Voir change_stock: retourne (quantité précédente, nouvelle quantité) ou None,
+    lève InsufficientStock si la sortie dépasse le stock disponible.
+    """
+    if transaction_type in STOCK_INCREASE_TYPES:
+        return change_stock(medicine_id, stock_delta=quantity)
+    if transaction_type in STOCK_DECREASE_TYPES:
+        return change_stock(medicine_id, stock_delta=-quantity, required=quantity)
+    return change_stock(medicine_id)
+
+def apply_stock_change(medicine_id, transaction_type, quantity, notes=None, user=None):
+    """Appliquer une transaction de stock dans la transaction SQL courante (sans commit)
+
+    Retourne la nouvelle quantité, ou None si le médicament n'existe pas.
+    Lève InsufficientStock si la sortie dépasse le stock disponible.
+    """
+    quantities = update_stock_quantity(medicine_id, transaction_type, quantity)
+    if quantities is None:
+        return None
+    previous_qty, new_qty = quantities
+
+    # Historique écrit dans la même transaction que le stock
+    db.session.add(StockHistory(
         medicine_id=medicine_id,
         transaction_type=transaction_type,
         quantity=abs(quantity),
@@ -144,22 +328,315 @@ def record_stock_transaction(medicine_id, transaction_type, quantity, notes=None
         new_quantity=new_qty,
         notes=notes,
         user=user
-    )
-    
-    # Mettre à jour le stock
-    medicine.stock_quantity = new_qty
-    medicine.updated_at = datetime.utcnow()
-    
-    db.session.add(history)
+    ))
+    return new_qty
+
+def record_stock_transaction(medicine_id, transaction_type, quantity, notes=None, user=None):
+    """Enregistrer une transaction de stock (stock et historique dans un même commit)
+
+    Retourne False si le médicament n'existe pas; lève InsufficientStock
+    (transaction annulée) si la sortie dépasse le stock disponible.
+    """
+    try:
+        new_qty = apply_stock_change(medicine_id, transaction_type, quantity, notes=notes, user=user)
+    except InsufficientStock:
+        db.session.rollback()
+        raise
+
+    if new_qty is None:
+        db.session.rollback()
+        return False
+
     db.session.commit()
-    
     return True
 
+def record_stock_transactions(entries, user=None):
+    """Enregistrer plusieurs transactions de stock en tout-ou-rien (un seul commit)
+
+    `entries` est une liste de dicts {medicine_id, transaction_type, quantity, notes}.
+    Les lignes sont traitées par medicine_id croissant (ordre d'origine conservé
+    pour un même médicament) afin que deux lots concurrents verrouillent les
+    lignes dans le même ordre. L'historique est inséré en une seule requête.
+
+    Retourne la liste des IDs inexistants (rien n'est enregistré s'il y en a);
+    lève InsufficientStock (transaction annulée) si une sortie dépasse le stock.
+    """
+    history_rows = []
+    missing = []
+    try:
+        for entry in sorted(entries, key=lambda e: e['medicine_id']):
+            quantities = update_stock_quantity(entry['medicine_id'], entry['transaction_type'], entry['quantity'])
+            if quantities is None:
+                missing.append(entry['medicine_id'])
+                continue
+            previous_qty, new_qty = quantities
+            history_rows.append({
+                'medicine_id': entry['medicine_id'],
+                'transaction_type': entry['transaction_type'],
+                'quantity': entry['quantity'],
+                'previous_quantity': previous_qty,
+                'new_quantity': new_qty,
+                'notes': entry.get('notes'),
+                'user': user
+            })
+    except InsufficientStock:
+        db.session.rollback()
+        raise
+
+    if missing:
+        db.session.rollback()
+        return sorted(set(missing))
+
+    if history_rows:
+        db.session.execute(StockHistory.__table__.insert(), history_rows)
+    db.session.commit()
+    return []
+
+class ReservationUnavailable(Exception):
+    """Réservation déjà consommée (ou dans un état qui ne permet pas l'opération)"""
+
+    def __init__(self, reservation, message=None):
+        super().__init__(message or f"Réservation {reservation.reference} déjà {reservation.status}")
+        self.reservation = reservation
+
+def parse_stock_items(raw_items):
+    """Valider une liste [{medicine_id, quantity}] et totaliser les quantités par médicament
+
+    Retourne {medicine_id: quantité}; lève ValueError si la liste est invalide.
+    """
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError('items doit être une liste non vide')
+    if len(raw_items) > MAX_BATCH_SIZE:
+        raise ValueError(f'Maximum {MAX_BATCH_SIZE} lignes par requête')
+
+    totals = {}
+    for index, raw in enumerate(raw_items):
+        try:
+            medicine_id = int(raw['medicine_id'])
+            quantity = int(raw['quantity'])
+        except (TypeError, ValueError, KeyError):
+            raise ValueError(f'Ligne {index}: medicine_id et quantity (entiers) requis')
+        if quantity <= 0:
+            raise ValueError(f'Ligne {index}: la quantité doit être positive')
+        totals[medicine_id] = totals.get(medicine_id, 0) + quantity
+    return totals
+
+def reservation_totals(reservation):
+    """Quantités réservées par médicament"""
+    return {item.medicine_id: item.quantity for item in reservation.items}
+
+def claim_reservation(reservation_id, new_status, *conditions):
+    """Changer le statut d'une réservation par un UPDATE conditionnel
+
+    Retourne True si cette transaction a effectué le changement: deux requêtes
+    concurrentes ne peuvent pas consommer ou libérer la même réservation.
+    """
+    updated = StockReservation.query.filter(StockReservation.id == reservation_id, *conditions).update(
+        {StockReservation.status: new_status, StockReservation.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    return updated == 1
+
+def release_reserved_quantities(totals):
+    """Rendre disponibles des quantités réservées (par medicine_id croissant)"""
+    for medicine_id in sorted(totals):
+        change_stock(medicine_id, reserved_delta=-totals[medicine_id])
+
+def reserve_stock(reference, totals, ttl_hours=None, user=None):
+    """Réserver des quantités pour plusieurs médicaments en tout-ou-rien (un seul commit)
+
+    Chaque médicament est réservé par un UPDATE atomique qui vérifie le stock
+    disponible; les réservations sont prises par medicine_id croissant pour que
+    deux réservations concurrentes verrouillent les lignes dans le même ordre.
+
+    Retourne (réservation, créée, IDs inexistants). Une référence déjà active
+    est renvoyée telle quelle (appel rejouable). Lève InsufficientStock si un
+    médicament n'a pas assez de stock disponible, ReservationUnavailable si la
+    référence existe dans un autre état.
+    """
+    existing = StockReservation.query.filter_by(reference=reference).first()
+    if existing:
+        if existing.status != 'active':
+            raise ReservationUnavailable(existing)
+        return existing, False, []
+
+    ttl = RESERVATION_TTL_HOURS if ttl_hours is None else ttl_hours
+    reservation = StockReservation(
+        reference=reference,
+        status='active',
+        expires_at=datetime.utcnow() + timedelta(hours=ttl),
+        user=user,
+        items=[StockReservationItem(medicine_id=m, quantity=q) for m, q in sorted(totals.items())]
+    )
+
+    missing = []
+    try:
+        for medicine_id in sorted(totals):
+            if change_stock(medicine_id, reserved_delta=totals[medicine_id], required=totals[medicine_id]) is None:
+                missing.append(medicine_id)
+        if missing:
+            db.session.rollback()
+            return None, False, missing
+        db.session.add(reservation)
+        db.session.commit()
+    except IntegrityError:
+        # Même référence réservée en parallèle: renvoyer la réservation gagnante
+        db.session.rollback()
+        existing = StockReservation.query.filter_by(reference=reference).first()
+        if existing is None or existing.status != 'active':
+            raise
+        return existing, False, []
+    except Exception:
+        db.session.rollback()
+        raise
+    return reservation, True, []
+
+def release_reservation(reservation):
+    """Libérer une réservation active (sans effet si elle ne l'est plus)"""
+    try:
+        if claim_reservation(reservation.id, 'released', StockReservation.status == 'active'):
+            release_reserved_quantities(reservation_totals(reservation))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.refresh(reservation)
+    return reservation
+
+def consume_reservation(reference, totals=None, user=None):
+    """Convertir une réservation en sorties de stock (dispensation), en un seul commit
+
+    `totals` ({medicine_id: quantité}) donne les quantités réellement dispensées;
+    par défaut, celles de la réservation. La part réservée est prélevée sur la
+    réservation, le surplus sur le stock disponible (vérifié atomiquement) et le
+    reliquat réservé non dispensé est libéré. Une réservation expirée ou libérée,
+    ou une référence sans réservation, est servie directement sur le stock
+    disponible. La référence est ensuite marquée consommée: rejouer la
+    dispensation lève ReservationUnavailable au lieu de sortir le stock deux fois.
+
+    Retourne (réservation, stocks {medicine_id: nouvelle quantité}, IDs inexistants).
+    """
+    now = datetime.utcnow()
+    reservation = StockReservation.query.filter_by(reference=reference).first()
+    reserved = {}
+    try:
+        if reservation is None:
+            if not totals:
+                return None, {}, []
+            reservation = StockReservation(reference=reference, status='consumed', expires_at=now, user=user)
+            db.session.add(reservation)
+        elif claim_reservation(reservation.id, 'consumed',
+                               StockReservation.status == 'active', StockReservation.expires_at > now):
+            reserved = reservation_totals(reservation)
+        elif claim_reservation(reservation.id, 'consumed', StockReservation.status == 'active'):
+            # Expirée mais pas encore libérée: rendre le stock réservé puis servir sur le disponible
+            release_reserved_quantities(reservation_totals(reservation))
+        elif not claim_reservation(reservation.id, 'consumed', StockReservation.status.in_(['expired', 'released'])):
+            db.session.rollback()
+            raise ReservationUnavailable(reservation)
+
+        if totals is None:
+            totals = reserved
+        if not totals:
+            db.session.rollback()
+            raise ReservationUnavailable(reservation, f"Réservation {reference} expirée ou libérée: quantités à dispenser requises")
+
+        history_rows = []
+        stock_levels = {}
+        missing = []
+        for medicine_id in sorted(set(totals) | set(reserved)):
+            quantity = totals.get(medicine_id, 0)
+            from_reservation = reserved.get(medicine_id, 0)
+            quantities = change_stock(
+                medicine_id,
+                stock_delta=-quantity,
+                reserved_delta=-from_reservation,
+                required=max(quantity - from_reservation, 0)
+            )
+            if quantities is None:
+                missing.append(medicine_id)
+                continue
+            previous_qty, new_qty = quantities
+            stock_levels[medicine_id] = new_qty
+            if quantity > 0:
+                history_rows.append({
+                    'medicine_id': medicine_id,
+                    'transaction_type': 'sale',
+                    'quantity': quantity,
+                    'previous_quantity': previous_qty,
+                    'new_quantity': new_qty,
+                    'notes': f'Réservation {reference}',
+                    'user': user
+                })
+
+        if missing:
+            db.session.rollback()
+            return None, {}, missing
+
+        if history_rows:
+            db.session.execute(StockHistory.__table__.insert(), history_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.refresh(reservation)
+    return reservation, stock_levels, []
+
+def release_expired_reservations():
+    """Libérer le stock des réservations actives arrivées à expiration"""
+    try:
+        expired = StockReservation.query.options(selectinload(StockReservation.items)).filter(
+            StockReservation.status == 'active',
+            StockReservation.expires_at <= datetime.utcnow()
+        ).order_by(StockReservation.id).all()
+
+        released_count = 0
+        for reservation in expired:
+            if claim_reservation(reservation.id, 'expired', StockReservation.status == 'active'):
+                release_reserved_quantities(reservation_totals(reservation))
+                released_count += 1
+        db.session.commit()
+
+        if released_count > 0:
+            print(f"✅ {released_count} réservations de stock expirées libérées")
+
+        return released_count
+
+    except Exception as e:
+        print(f"Erreur lors de la libération des réservations expirées: {e}")
+        db.session.rollback()
+        return 0
+
+def run_reservation_sweeper(stop_event):
+    """Boucle de fond: libère les réservations expirées à intervalle régulier"""
+    while True:
+        with app.app_context():
+            release_expired_reservations()
+        if stop_event.wait(RESERVATION_SWEEP_INTERVAL):
+            break
+
+def start_reservation_sweeper():
+    """Démarrer le thread de libération des réservations expirées"""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_reservation_sweeper,
+        args=(stop_event,),
+        name='reservation-sweeper',
+        daemon=True
+    )
+    thread.start()
+    return stop_event
+
 # ==================== ROUTES ====================
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'medicine-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'medicine-service', 'auth': jwt_auth.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return instrumentation.metrics_response()
 
 @app.route('/api/medicines', methods=['GET'])
 def get_medicines():
@@ -198,17 +675,90 @@ def get_medicines():
         elif stock_status == 'in_stock':
             query = query.filter(Medicine.stock_quantity > Medicine.min_stock_level)
         
-        # Pagination
-        pagination = query.order_by(Medicine.name).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, Medicine.name, Medicine.id, descending=False)
+        else:
+            pagination = query.order_by(Medicine.name).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
+        
+        return jsonify({
+            'success': True,
+            'medicines': [m.to_dict() for m in items],
+            **page_info
+        }), 200
+        
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/medicines/batch', methods=['GET', 'POST'])
+def get_medicines_batch():
+    """Récupérer plusieurs médicaments par ID en une seule requête"""
+    try:
+        # IDs via ?ids=1,2,3 ou via un corps JSON {"ids": [1, 2, 3]}
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            raw_ids = data.get('ids', []) if isinstance(data, dict) else None
+            # Une chaîne "12" serait parcourue caractère par caractère (IDs 1 et 2)
+            if not isinstance(raw_ids, list) or any(isinstance(i, (bool, float)) for i in raw_ids):
+                return jsonify({'success': False, 'error': 'ids doit être une liste d\'entiers'}), 400
+        else:
+            raw_ids = [i for i in request.args.get('ids', '').split(',') if i.strip()]
+
+        try:
+            medicine_ids = {int(i) for i in raw_ids}
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'ids doit être une liste d\'entiers'}), 400
+
+        if len(medicine_ids) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'error': f'Maximum {MAX_BATCH_SIZE} IDs par requête'}), 400
+
+        medicines = Medicine.query.filter(Medicine.id.in_(medicine_ids)).all() if medicine_ids else []
+
+        return jsonify({
+            'success': True,
+            'medicines': [m.to_dict() for m in medicines],
+            'missing': sorted(medicine_ids - {m.id for m in medicines})
+        }), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/medicines/changes', methods=['GET'])
+def get_medicine_changes():
+    """IDs des médicaments modifiés ou supprimés depuis `since` (flux d'invalidation des caches clients)"""
+    try:
+        # Horodatage lu avant la requête: à repasser comme `since` au prochain appel
+        as_of = datetime.utcnow()
+        since = request.args.get('since')
+        
+        changed = []
+        deleted = []
+        if since:
+            try:
+                since = datetime.fromisoformat(since)
+            except ValueError:
+                return jsonify({'success': False, 'error': 'since doit être une date ISO 8601'}), 400
+            changed = [
+                medicine_id for (medicine_id,) in
+                db.session.query(Medicine.id).filter(Medicine.updated_at >= since).order_by(Medicine.id)
+            ]
+            deleted = [
+                medicine_id for (medicine_id,) in
+                db.session.query(DeletedMedicine.medicine_id).filter(DeletedMedicine.deleted_at >= since)
+                .distinct().order_by(DeletedMedicine.medicine_id)
+            ]
         
         return jsonify({
             'success': True,
-            'medicines': [m.to_dict() for m in pagination.items],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            'as_of': as_of.isoformat(),
+            'changed': changed,
+            'deleted': deleted
         }), 200
         
     except Exception as e:
@@ -252,7 +802,7 @@ def create_medicine():
             description=data.get('description'),
             dosage_form=data['dosage_form'],
             strength=data.get('strength'),
-            stock_quantity=data.get('stock_quantity', 0),
+            stock_quantity=0,
             min_stock_level=data.get('min_stock_level', 10),
             unit_price=data.get('unit_price', 0.0),
             requires_prescription=data.get('requires_prescription', True),
@@ -261,17 +811,19 @@ def create_medicine():
         )
         
         db.session.add(medicine)
-        db.session.commit()
+        db.session.flush()
         
-        # Enregistrer le stock initial
-        if medicine.stock_quantity > 0:
-            record_stock_transaction(
+        # Enregistrer le stock initial (entrée d'historique comprise) dans la même transaction
+        initial_stock = int(data.get('stock_quantity', 0))
+        if initial_stock > 0:
+            apply_stock_change(
                 medicine.id,
                 'purchase',
-                medicine.stock_quantity,
+                initial_stock,
                 notes='Stock initial',
                 user=data.get('user', 'System')
             )
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -323,6 +875,7 @@ def delete_medicine(medicine_id):
     try:
         medicine = Medicine.query.get_or_404(medicine_id)
         db.session.delete(medicine)
+        db.session.add(DeletedMedicine(medicine_id=medicine_id))
         db.session.commit()
         
         return jsonify({
@@ -343,6 +896,8 @@ def get_medicine_stock(medicine_id):
             'success': True,
             'medicine_id': medicine_id,
             'stock': medicine.stock_quantity,
+            'reserved': medicine.reserved_quantity,
+            'available': medicine.stock_quantity - medicine.reserved_quantity,
             'min_level': medicine.min_stock_level,
             'status': medicine.get_stock_status()
         }), 200
@@ -359,9 +914,8 @@ def update_medicine_stock(medicine_id):
         if 'transaction_type' not in data or 'quantity' not in data:
             return jsonify({'success': False, 'error': 'transaction_type et quantity requis'}), 400
         
-        valid_types = ['purchase', 'sale', 'adjustment_increase', 'adjustment_decrease', 'expired']
-        if data['transaction_type'] not in valid_types:
-            return jsonify({'success': False, 'error': f'Type de transaction invalide. Utilisez: {valid_types}'}), 400
+        if data['transaction_type'] not in STOCK_TRANSACTION_TYPES:
+            return jsonify({'success': False, 'error': f'Type de transaction invalide. Utilisez: {list(STOCK_TRANSACTION_TYPES)}'}), 400
         
         quantity = int(data['quantity'])
         if quantity <= 0:
@@ -387,6 +941,79 @@ def update_medicine_stock(medicine_id):
             'medicine': medicine.to_dict()
         }), 200
         
+    except InsufficientStock as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'available': e.available
+        }), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/medicines/stock/batch', methods=['POST'])
+def update_stock_batch():
+    """Appliquer plusieurs transactions de stock en une seule transaction (livraison, dispensation)"""
+    try:
+        data = request.get_json() or {}
+        raw_entries = data.get('transactions')
+        
+        # Validation
+        if not isinstance(raw_entries, list) or not raw_entries:
+            return jsonify({'success': False, 'error': 'transactions doit être une liste non vide'}), 400
+        
+        if len(raw_entries) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'error': f'Maximum {MAX_BATCH_SIZE} transactions par requête'}), 400
+        
+        entries = []
+        for index, raw in enumerate(raw_entries):
+            if not isinstance(raw, dict) or not all(k in raw for k in ('medicine_id', 'transaction_type', 'quantity')):
+                return jsonify({'success': False, 'error': f'Transaction {index}: medicine_id, transaction_type et quantity requis'}), 400
+            if raw['transaction_type'] not in STOCK_TRANSACTION_TYPES:
+                return jsonify({'success': False, 'error': f'Transaction {index}: type invalide. Utilisez: {list(STOCK_TRANSACTION_TYPES)}'}), 400
+            try:
+                medicine_id = int(raw['medicine_id'])
+                quantity = int(raw['quantity'])
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': f'Transaction {index}: medicine_id et quantity doivent être des entiers'}), 400
+            if quantity <= 0:
+                return jsonify({'success': False, 'error': f'Transaction {index}: la quantité doit être positive'}), 400
+            entries.append({
+                'medicine_id': medicine_id,
+                'transaction_type': raw['transaction_type'],
+                'quantity': quantity,
+                'notes': raw.get('notes', data.get('notes'))
+            })
+        
+        # Enregistrer toutes les transactions (tout ou rien)
+        missing = record_stock_transactions(entries, user=data.get('user', 'System'))
+        if missing:
+            return jsonify({'success': False, 'error': 'Médicaments non trouvés', 'missing': missing}), 404
+        
+        medicine_ids = {e['medicine_id'] for e in entries}
+        medicines = Medicine.query.filter(Medicine.id.in_(medicine_ids)).all()
+        
+        return jsonify({
+            'success': True,
+            'message': f'{len(entries)} transaction(s) enregistrée(s)',
+            'medicines': [
+                {
+                    'id': m.id,
+                    'name': m.name,
+                    'stock_quantity': m.stock_quantity,
+                    'stock_status': m.get_stock_status()
+                }
+                for m in medicines
+            ]
+        }), 200
+        
+    except InsufficientStock as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'medicine_id': e.medicine_id,
+            'available': e.available
+        }), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -400,19 +1027,27 @@ def get_stock_history(medicine_id):
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         
-        pagination = StockHistory.query.filter_by(medicine_id=medicine_id)\
-            .order_by(StockHistory.transaction_date.desc())\
-            .paginate(page=page, per_page=per_page, error_out=False)
+        query = StockHistory.query.filter_by(medicine_id=medicine_id)
+        
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, StockHistory.transaction_date, StockHistory.id)
+        else:
+            pagination = query.order_by(StockHistory.transaction_date.desc()).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
         
         return jsonify({
             'success': True,
             'medicine': medicine.to_dict(include_history=False),
-            'history': [h.to_dict() for h in pagination.items],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            'history': [h.to_dict() for h in items],
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -458,24 +1093,19 @@ def get_expiring_medicines():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/medicines/stats', methods=['GET'])
+@stats_cache.cached_response
 def get_medicine_stats():
     """Obtenir les statistiques des médicaments"""
     try:
-        total = Medicine.query.count()
-        in_stock = Medicine.query.filter(
-            Medicine.stock_quantity > Medicine.min_stock_level
-        ).count()
-        low_stock = Medicine.query.filter(
-            Medicine.stock_quantity > 0,
-            Medicine.stock_quantity <= Medicine.min_stock_level
-        ).count()
-        out_of_stock = Medicine.query.filter_by(stock_quantity=0).count()
-        
-        # Valeur totale du stock
-        from sqlalchemy import func
-        total_value = db.session.query(
+        # Compteurs et valeur totale du stock en une seule passe sur la table
+        total, in_stock, low_stock, out_of_stock, total_value = db.session.query(
+            func.count(Medicine.id),
+            count_where(Medicine.stock_quantity > Medicine.min_stock_level),
+            count_where(Medicine.stock_quantity > 0, Medicine.stock_quantity <= Medicine.min_stock_level),
+            count_where(Medicine.stock_quantity == 0),
             func.sum(Medicine.stock_quantity * Medicine.unit_price)
-        ).scalar() or 0
+        ).one()
+        total_value = total_value or 0
         
         # Catégories
         categories = db.session.query(
@@ -501,6 +1131,133 @@ def get_medicine_stats():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/reservations', methods=['POST'])
+def create_reservation():
+    """Réserver du stock pour toutes les lignes d'une ordonnance en un seul appel"""
+    try:
+        data = request.get_json() or {}
+        
+        if not data.get('reference'):
+            return jsonify({'success': False, 'error': 'reference est requis'}), 400
+        
+        try:
+            totals = parse_stock_items(data.get('items'))
+            ttl_hours = float(data['ttl_hours']) if 'ttl_hours' in data else None
+            if ttl_hours is not None and not 0 < ttl_hours <= MAX_RESERVATION_TTL_HOURS:
+                raise ValueError(f'ttl_hours doit être compris entre 0 (exclu) et {MAX_RESERVATION_TTL_HOURS:g}')
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        reservation, created, missing = reserve_stock(
+            str(data['reference']),
+            totals,
+            ttl_hours=ttl_hours,
+            user=data.get('user', 'System')
+        )
+        if missing:
+            return jsonify({'success': False, 'error': 'Médicaments non trouvés', 'missing': missing}), 404
+        
+        return jsonify({
+            'success': True,
+            'message': 'Stock réservé avec succès' if created else 'Réservation déjà existante',
+            'reservation': reservation.to_dict()
+        }), 201 if created else 200
+        
+    except InsufficientStock as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'medicine_id': e.medicine_id,
+            'available': e.available
+        }), 409
+    except ReservationUnavailable as e:
+        return jsonify({'success': False, 'error': str(e), 'reservation': e.reservation.to_dict()}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reservations/<reference>', methods=['GET'])
+def get_reservation(reference):
+    """Récupérer une réservation par référence"""
+    try:
+        reservation = StockReservation.query.filter_by(reference=reference).first_or_404()
+        return jsonify({'success': True, 'reservation': reservation.to_dict()}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+@app.route('/api/reservations/<reference>/consume', methods=['POST'])
+def consume_reservation_route(reference):
+    """Convertir une réservation en ventes (dispensation de l'ordonnance)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            totals = parse_stock_items(data['items']) if 'items' in data else None
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        reservation, stock_levels, missing = consume_reservation(reference, totals, user=data.get('user', 'System'))
+        if missing:
+            return jsonify({'success': False, 'error': 'Médicaments non trouvés', 'missing': missing}), 404
+        if reservation is None:
+            return jsonify({'success': False, 'error': 'Réservation non trouvée'}), 404
+        
+        return jsonify({
+            'success': True,
+            'message': 'Réservation dispensée avec succès',
+            'reservation': reservation.to_dict(),
+            'stock': [
+                {'medicine_id': medicine_id, 'stock_quantity': qty}
+                for medicine_id, qty in sorted(stock_levels.items())
+            ]
+        }), 200
+        
+    except InsufficientStock as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'medicine_id': e.medicine_id,
+            'available': e.available
+        }), 409
+    except ReservationUnavailable as e:
+        return jsonify({'success': False, 'error': str(e), 'reservation': e.reservation.to_dict()}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reservations/<reference>/release', methods=['POST'])
+def release_reservation_route(reference):
+    """Libérer le stock d'une réservation (ordonnance annulée)"""
+    try:
+        reservation = StockReservation.query.filter_by(reference=reference).first()
+        if not reservation:
+            return jsonify({'success': False, 'error': 'Réservation non trouvée'}), 404
+        
+        reservation = release_reservation(reservation)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Réservation libérée' if reservation.status == 'released' else f'Réservation déjà {reservation.status}',
+            'reservation': reservation.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reservations/release-expired', methods=['POST'])
+def manual_release_expired_reservations():
+    """Libérer manuellement les réservations expirées"""
+    try:
+        released_count = release_expired_reservations()
+        return jsonify({
+            'success': True,
+            'message': f'{released_count} réservations expirées libérées',
+            'released_count': released_count
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/medicines/categories', methods=['GET'])
 def get_categories():
     """Récupérer toutes les catégories de médicaments"""
@@ -540,10 +1297,26 @@ def create_category():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CLI ====================
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Ajouter les colonnes et index manquants à une base existante"""
+    create_missing_columns()
+    create_missing_indexes()
+    print("✅ Index créés")
+
+@app.cli.command('release-expired-reservations')
+def release_expired_reservations_command():
+    """Libérer les réservations expirées (à lancer via cron ou un worker dédié)"""
+    released_count = release_expired_reservations()
+    print(f"{released_count} réservations expirées libérées")
+
 # ==================== MAIN ====================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_columns()
+        create_missing_indexes()
         
         # Créer des catégories par défaut
         default_categories = [
@@ -563,5 +1336,9 @@ if __name__ == '__main__':
         db.session.commit()
         print("✅ Medicine Service: Database tables created successfully!")
     
+    # Avec le reloader de debug, ne démarrer le sweeper que dans le processus servant les requêtes
+    if RESERVATION_SWEEP_INTERVAL > 0 and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_reservation_sweeper()
+    
     port = int(os.getenv('PORT', 5005))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,129 @@
+# Vérification locale des JWT émis par l'auth-service. Fichier identique dans
+# chaque service (chaque image Docker est construite à partir du dossier du
+# service).
+#
+# Le jeton est vérifié sur place (signature, expiration, type "access") avec
+# la clé chargée une seule fois au démarrage, sans appel à l'auth-service:
+# - HS256 (défaut): même JWT_SECRET que l'auth-service;
+# - RS256/ES256: clé publique JWT_PUBLIC_KEY ou JWT_PUBLIC_KEY_FILE (le
+#   paquet cryptography doit être installé), l'auth-service signant avec la
+#   clé privée correspondante.
+#
+# JWT_AUTH_MODE: "required" refuse les requêtes sans jeton valide,
+# "optional" ne refuse que les jetons invalides, "off" désactive la
+# vérification. Les chemins de JWT_AUTH_EXEMPT_PATHS ne sont jamais vérifiés;
+# les routes publiques (`public_routes`, par ex. la prise de rendez-vous sans
+# compte) acceptent les requêtes sans jeton même en mode "required".
+#
+# Les appels entre services sans jeton d'utilisateur (threads de fond,
+# routes publiques) portent le jeton de service SERVICE_TOKEN, émis par
+# `flask issue-service-token <service>` dans l'auth-service (voir
+# service_client.py).
+#
+# "optional" reste le défaut tant que le frontend React n'envoie pas l'en-tête
+# Authorization (aucune page ne le fait aujourd'hui): en "required", toutes
+# ses pages d'administration seraient refusées. Une fois le frontend à jour,
+# déployer avec JWT_AUTH_MODE=required et SERVICE_TOKEN renseigné pour
+# appointment-service, billing-service et prescription-service.
+#
+# La révocation (compte désactivé, jetons révoqués) n'est connue que de
+# l'auth-service: ici un jeton reste valide jusqu'à son expiration.
+
+import os
+import threading
+
+import jwt
+from flask import g, jsonify, request
+from jwt.algorithms import get_default_algorithms
+
+AUTH_MODE = os.getenv('JWT_AUTH_MODE', 'optional')
+ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
+PUBLIC_KEY = os.getenv('JWT_PUBLIC_KEY')
+PUBLIC_KEY_FILE = os.getenv('JWT_PUBLIC_KEY_FILE')
+EXEMPT_PATHS = tuple(p for p in os.getenv('JWT_AUTH_EXEMPT_PATHS', '/health,/metrics').split(',') if p)
+LEEWAY = float(os.getenv('JWT_LEEWAY', 0))
+
+
+class JWTAuth:
+    """Middleware Flask de vérification des jetons d'accès
+
+    Les claims du jeton vérifié sont disponibles dans `g.jwt_claims`
+    (None sans jeton). `public_routes` liste des couples (méthode, chemin
+    exact) accessibles sans jeton quel que soit le mode. Les compteurs
+    `verified` et `rejected` sont exposés par `stats()`.
+    """
+
+    def __init__(self, mode=AUTH_MODE, algorithm=ALGORITHM, exempt_paths=EXEMPT_PATHS, leeway=LEEWAY,
+                 public_routes=()):
+        self.mode = mode
+        self.algorithm = algorithm
+        self.exempt_paths = exempt_paths
+        self.public_routes = frozenset(public_routes)
+        self.leeway = leeway
+        self.key = self._load_key() if mode != 'off' else None
+        self._lock = threading.Lock()
+        self.verified = 0
+        self.rejected = 0
+
+    def _load_key(self):
+        """Préparer la clé une fois pour toutes (PEM déjà analysé pour RS256/ES256)"""
+        algorithms = get_default_algorithms()
+        if self.algorithm not in algorithms:
+            raise RuntimeError(f"Algorithme JWT {self.algorithm} non disponible (paquet cryptography installé?)")
+        if self.algorithm.startswith('HS'):
+            key = SECRET
+        elif PUBLIC_KEY_FILE:
+            with open(PUBLIC_KEY_FILE) as f:
+                key = f.read()
+        else:
+            key = PUBLIC_KEY
+        if not key:
+            raise RuntimeError(f"Clé de vérification manquante pour {self.algorithm} (JWT_PUBLIC_KEY ou JWT_PUBLIC_KEY_FILE)")
+        return algorithms[self.algorithm].prepare_key(key)
+
+    def init_app(self, app):
+        @app.before_request
+        def verify_jwt():
+            g.jwt_claims = None
+            if self.mode == 'off' or request.method == 'OPTIONS' or request.path.startswith(self.exempt_paths):
+                return None
+
+            header = request.headers.get('Authorization', '')
+            if not header:
+                if self.mode == 'required' and (request.method, request.path) not in self.public_routes:
+                    return self._reject('Jeton d\'authentification requis')
+                return None
+
+            scheme, _, token = header.partition(' ')
+            if scheme.lower() != 'bearer' or not token:
+                return self._reject('En-tête Authorization invalide (Bearer <jeton> attendu)')
+
+            try:
+                claims = jwt.decode(token, self.key, algorithms=[self.algorithm], leeway=self.leeway)
+            except jwt.ExpiredSignatureError:
+                return self._reject('Jeton expiré')
+            except jwt.InvalidTokenError:
+                return self._reject('Jeton invalide')
+
+            if claims.get('type', 'access') != 'access':
+                return self._reject('Jeton d\'accès attendu')
+
+            g.jwt_claims = claims
+            with self._lock:
+                self.verified += 1
+            return None
+
+    def _reject(self, message):
+        with self._lock:
+            self.rejected += 1
+        return jsonify({'success': False, 'error': message}), 401
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'algorithm': self.algorithm,
+                'verified': self.verified,
+                'rejected': self.rejected
+            }
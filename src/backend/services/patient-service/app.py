@@ -2,8 +2,18 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func, case, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
 from datetime import datetime
+import csv
+import json
 import os
+from stats_cache import StatsCache
+from instrumentation import Instrumentation
+from jwt_auth import JWTAuth
+from pagination import cursor_requested, keyset_paginate, InvalidCursor
+from streaming_export import export_response, EXPORT_FORMATS
 
 app = Flask(__name__)
 CORS(app)
@@ -15,6 +25,31 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Cache des statistiques (vidé à chaque écriture)
+stats_cache = StatsCache(
+    ttl=float(os.getenv('STATS_CACHE_TTL', 5)),
+    max_size=int(os.getenv('STATS_CACHE_MAX_SIZE', 128))
+)
+stats_cache.init_app(app)
+
+# Mesures par requête (en-tête Server-Timing et endpoint /metrics)
+instrumentation = Instrumentation('patient-service')
+instrumentation.init_app(app)
+
+# Vérification locale des jetons de l'auth-service (JWT_AUTH_MODE: off, optional, required)
+jwt_auth = JWTAuth()
+jwt_auth.init_app(app)
+
+# Nombre maximum d'IDs acceptés par /api/patients/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 500))
+
+# Import en masse: taille des lots insérés/commités et nombre maximum d'erreurs détaillées
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+
+# Nombre maximum de résultats de /api/patients/search
+MAX_SEARCH_RESULTS = int(os.getenv('MAX_SEARCH_RESULTS', 50))
+
 # ==================== MODELS ====================
 class Patient(db.Model):
     __tablename__ = 'patients'
@@ -33,6 +68,13 @@ class Patient(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Recherche exacte insensible à la casse (by-email, get-or-create, import)
+        db.Index('ix_patients_email_lower', func.lower(email)),
+        # Liste triée par date de création (pagination par curseur sur (created_at, id))
+        db.Index('ix_patients_created_at_id', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -50,6 +92,280 @@ class Patient(db.Model):
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+# ==================== HELPER FUNCTIONS ====================
+def count_where(*conditions):
+    """Compter les lignes vérifiant les conditions (SUM(CASE WHEN ... THEN 1 ELSE 0 END))"""
+    return func.coalesce(func.sum(case((db.and_(*conditions), 1), else_=0)), 0)
+
+def create_missing_indexes():
+    """Créer sur une base existante les index déclarés dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les index manquants. CREATE INDEX IF NOT EXISTS plutôt que
+    checkfirst: la réflexion SQLite ignore les index d'expression
+    (lower(email)), qui seraient recréés à chaque démarrage.
+    """
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+def normalize_email(email):
+    """Forme canonique d'un email (sans espaces, en minuscules)"""
+    if not isinstance(email, str):
+        raise ValueError('email doit être une chaîne de caractères')
+    return email.strip().lower()
+
+def find_patient_by_email(email):
+    """Patient ayant cet email, sans tenir compte de la casse (index ix_patients_email_lower)"""
+    return Patient.query.filter(func.lower(Patient.email) == normalize_email(email)).first()
+
+REQUIRED_PATIENT_FIELDS = ['first_name', 'last_name', 'email', 'phone', 'date_of_birth', 'gender']
+OPTIONAL_PATIENT_FIELDS = ['address', 'blood_group', 'allergies', 'medical_history']
+
+def patient_from_data(data):
+    """Construire un Patient à partir des données JSON d'une requête"""
+    return Patient(
+        first_name=data['first_name'],
+        last_name=data['last_name'],
+        email=normalize_email(data['email']),
+        phone=data['phone'],
+        date_of_birth=datetime.strptime(data['date_of_birth'], '%Y-%m-%d'),
+        gender=data['gender'],
+        address=data.get('address'),
+        blood_group=data.get('blood_group'),
+        allergies=data.get('allergies'),
+        medical_history=data.get('medical_history')
+    )
+
+def validate_import_row(row):
+    """Valider une ligne d'import et la convertir en valeurs de colonnes"""
+    if not isinstance(row, dict):
+        raise ValueError('ligne invalide (objet attendu)')
+    if None in row:
+        # csv.DictReader range les valeurs sans colonne d'en-tête sous la clé None
+        raise ValueError('ligne invalide (plus de valeurs que de colonnes)')
+    for field in REQUIRED_PATIENT_FIELDS:
+        if not row.get(field):
+            raise ValueError(f'{field} est requis')
+        if not isinstance(row[field], str):
+            raise ValueError(f'{field} doit être une chaîne de caractères')
+    for field in OPTIONAL_PATIENT_FIELDS:
+        if row.get(field) is not None and not isinstance(row[field], str):
+            raise ValueError(f'{field} doit être une chaîne de caractères')
+    try:
+        date_of_birth = datetime.strptime(row['date_of_birth'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError('date_of_birth doit être au format YYYY-MM-DD')
+    
+    now = datetime.utcnow()
+    return {
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'email': normalize_email(row['email']),
+        'phone': row['phone'],
+        'date_of_birth': date_of_birth,
+        'gender': row['gender'],
+        'address': row.get('address') or None,
+        'blood_group': row.get('blood_group') or None,
+        'allergies': row.get('allergies') or None,
+        'medical_history': row.get('medical_history') or None,
+        'created_at': now,
+        'updated_at': now
+    }
+
+class ImportStreamError(Exception):
+    """Corps illisible au-delà d'une ligne (encodage, CSV malformé): l'import s'arrête là"""
+    
+    def __init__(self, line_number, message):
+        super().__init__(message)
+        self.line_number = line_number
+
+def iter_import_rows(stream, file_format):
+    """Lire le corps de la requête ligne par ligne: (numéro de ligne, données ou erreur)
+
+    Lève ImportStreamError si la suite du corps ne peut pas être lue.
+    """
+    position = {'line': 0}
+    
+    def text_lines():
+        # Décodage ligne par ligne: une erreur d'encodage est attribuée à sa ligne
+        for raw_line in stream:
+            position['line'] += 1
+            try:
+                yield raw_line.decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise ImportStreamError(position['line'], f'Encodage invalide (UTF-8 attendu): {e.reason}')
+    
+    if file_format == 'csv':
+        reader = csv.DictReader(text_lines())
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except csv.Error as e:
+            raise ImportStreamError(position['line'], f'CSV invalide: {e}')
+    else:
+        for line_number, line in enumerate(text_lines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f'JSON invalide: {e.msg}')
+
+def insert_import_chunk(chunk, report):
+    """Insérer un lot de patients validés (emails déjà existants rejetés) et le commiter"""
+    emails = [values['email'] for _, values in chunk]
+    existing = {
+        email.lower() for (email,) in db.session.query(Patient.email).filter(func.lower(Patient.email).in_(emails))
+    }
+    rows = []
+    for line_number, values in chunk:
+        if values['email'] in existing:
+            add_import_error(report, line_number, 'Email déjà utilisé')
+        else:
+            rows.append((line_number, values))
+    if not rows:
+        return
+    try:
+        db.session.execute(Patient.__table__.insert(), [values for _, values in rows])
+        db.session.commit()
+        report['imported'] += len(rows)
+    except IntegrityError:
+        # Email créé entre-temps par une autre requête: insérer ligne par ligne
+        # pour n'écarter que les lignes en conflit
+        db.session.rollback()
+        for line_number, values in rows:
+            try:
+                db.session.execute(Patient.__table__.insert(), [values])
+                db.session.commit()
+                report['imported'] += 1
+            except IntegrityError:
+                db.session.rollback()
+                add_import_error(report, line_number, 'Email déjà utilisé')
+
+def add_import_error(report, line_number, message):
+    report['failed'] += 1
+    if len(report['errors']) < IMPORT_MAX_ERRORS:
+        report['errors'].append({'line': line_number, 'error': message})
+    else:
+        report['errors_truncated'] = True
+
+# ==================== SEARCH INDEX ====================
+# Index de recherche sur nom, prénom et email, maintenu par la base elle-même
+# (triggers SQLite / index d'expression PostgreSQL) à chaque création,
+# modification ou suppression de patient.
+#   - SQLite: table virtuelle FTS5 avec le tokenizer trigram
+#   - PostgreSQL: index GIN pg_trgm, utilisable par ILIKE '%terme%'
+# Les termes de moins de 3 caractères ne peuvent pas utiliser un index trigram
+# et passent par l'ancienne recherche ILIKE.
+
+SEARCH_EXPRESSION = "first_name || ' ' || last_name || ' ' || email"
+MIN_INDEXED_TERM_LENGTH = 3
+
+SQLITE_SEARCH_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+        first_name, last_name, email,
+        content='patients', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patients_fts(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_update AFTER UPDATE OF first_name, last_name, email ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        INSERT INTO patients_fts(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+]
+
+POSTGRES_SEARCH_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_patients_search_trgm ON patients USING gin (({SEARCH_EXPRESSION}) gin_trgm_ops)",
+]
+
+_search_backend = {}
+
+def setup_search_index():
+    """Créer l'index de recherche (et indexer les patients existants)"""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as conn:
+        if dialect == 'sqlite':
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+            )).first()
+            for statement in SQLITE_SEARCH_SETUP:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            for statement in POSTGRES_SEARCH_SETUP:
+                conn.execute(text(statement))
+    _search_backend.clear()
+
+def get_search_backend():
+    """Retourner 'fts5', 'trigram' ou None si aucun index de recherche n'existe"""
+    if 'backend' not in _search_backend:
+        dialect = db.engine.dialect.name
+        backend = None
+        if dialect == 'sqlite':
+            if db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+            )).first():
+                backend = 'fts5'
+        elif dialect == 'postgresql':
+            if db.session.execute(text(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_patients_search_trgm'"
+            )).first():
+                backend = 'trigram'
+        _search_backend['backend'] = backend
+    return _search_backend['backend']
+
+def fts5_phrase(term):
+    """Échapper un terme pour une requête MATCH FTS5 (recherche de sous-chaîne)"""
+    return '"' + term.replace('"', '""') + '"'
+
+def search_filter(term):
+    """Condition SQL sélectionnant les patients qui contiennent `term`"""
+    backend = get_search_backend() if len(term) >= MIN_INDEXED_TERM_LENGTH else None
+    if backend == 'fts5':
+        matching_ids = text("SELECT rowid FROM patients_fts WHERE patients_fts MATCH :phrase")\
+            .bindparams(phrase=fts5_phrase(term)).columns(rowid=db.Integer)
+        return Patient.id.in_(matching_ids)
+    if backend == 'trigram':
+        matching_ids = text(f"SELECT id FROM patients WHERE ({SEARCH_EXPRESSION}) ILIKE :pattern")\
+            .bindparams(pattern=f'%{term}%').columns(id=db.Integer)
+        return Patient.id.in_(matching_ids)
+    return db.or_(
+        Patient.first_name.ilike(f'%{term}%'),
+        Patient.last_name.ilike(f'%{term}%'),
+        Patient.email.ilike(f'%{term}%')
+    )
+
+def ranked_search(term, limit):
+    """IDs des patients correspondant à `term` (du plus pertinent au moins pertinent)
+    et moteur de recherche utilisé
+    """
+    backend = get_search_backend() if len(term) >= MIN_INDEXED_TERM_LENGTH else None
+    if backend == 'fts5':
+        rows = db.session.execute(text(
+            "SELECT rowid FROM patients_fts WHERE patients_fts MATCH :phrase ORDER BY rank LIMIT :limit"
+        ), {'phrase': fts5_phrase(term), 'limit': limit})
+    elif backend == 'trigram':
+        rows = db.session.execute(text(
+            f"SELECT id FROM patients WHERE ({SEARCH_EXPRESSION}) ILIKE :pattern "
+            f"ORDER BY similarity({SEARCH_EXPRESSION}, :term) DESC LIMIT :limit"
+        ), {'pattern': f'%{term}%', 'term': term, 'limit': limit})
+    else:
+        rows = db.session.query(Patient.id).filter(search_filter(term))\
+            .order_by(Patient.last_name, Patient.first_name).limit(limit)
+    return [row[0] for row in rows], backend or 'ilike'
+
 # ==================== ROUTES ====================
 @app.route('/')
 def home():
@@ -58,7 +374,12 @@ def home():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'patient-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'patient-service', 'auth': jwt_auth.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return instrumentation.metrics_response()
 
 @app.route('/api/patients', methods=['GET'])
 def get_patients():
@@ -70,32 +391,96 @@ def get_patients():
         
         query = Patient.query
         
-        # Recherche
+        # Recherche (via l'index de recherche quand il existe)
         if search:
-            query = query.filter(
-                db.or_(
-                    Patient.first_name.ilike(f'%{search}%'),
-                    Patient.last_name.ilike(f'%{search}%'),
-                    Patient.email.ilike(f'%{search}%')
-                )
+            query = query.filter(search_filter(search))
+        
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, Patient.created_at, Patient.id)
+        else:
+            pagination = query.order_by(Patient.created_at.desc()).paginate(
+                page=page, per_page=per_page, error_out=False
             )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
         
-        # Pagination
-        pagination = query.order_by(Patient.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        return jsonify({
+            'success': True,
+            'patients': [p.to_dict() for p in items],
+            **page_info
+        }), 200
+        
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/patients/export', methods=['GET'])
+def export_patients():
+    """Exporter tous les patients en CSV ou NDJSON (streaming)"""
+    file_format = request.args.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'format doit être csv ou ndjson'}), 400
+    
+    query = Patient.query.order_by(Patient.id)
+    return export_response(query, file_format, 'patients')
+
+@app.route('/api/patients/search', methods=['GET'])
+def search_patients():
+    """Rechercher des patients par nom, prénom ou email, triés par pertinence"""
+    try:
+        term = request.args.get('q', '').strip()
+        limit = max(1, min(request.args.get('limit', 20, type=int), MAX_SEARCH_RESULTS))
+        
+        if not term:
+            return jsonify({'success': False, 'error': 'q est requis'}), 400
+        
+        patient_ids, backend = ranked_search(term, limit)
+        patients = {p.id: p for p in Patient.query.filter(Patient.id.in_(patient_ids)).all()} if patient_ids else {}
         
         return jsonify({
             'success': True,
-            'patients': [p.to_dict() for p in pagination.items],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            'patients': [patients[i].to_dict() for i in patient_ids if i in patients],
+            'search_backend': backend
         }), 200
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/patients/batch', methods=['GET', 'POST'])
+def get_patients_batch():
+    """Récupérer plusieurs patients par ID en une seule requête"""
+    try:
+        # IDs via ?ids=1,2,3 ou via un corps JSON {"ids": [1, 2, 3]}
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            raw_ids = data.get('ids', []) if isinstance(data, dict) else None
+            # Une chaîne "12" serait parcourue caractère par caractère (IDs 1 et 2)
+            if not isinstance(raw_ids, list) or any(isinstance(i, (bool, float)) for i in raw_ids):
+                return jsonify({'success': False, 'error': 'ids doit être une liste d\'entiers'}), 400
+        else:
+            raw_ids = [i for i in request.args.get('ids', '').split(',') if i.strip()]
+
+        try:
+            patient_ids = {int(i) for i in raw_ids}
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'ids doit être une liste d\'entiers'}), 400
+
+        if len(patient_ids) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'error': f'Maximum {MAX_BATCH_SIZE} IDs par requête'}), 400
+
+        patients = Patient.query.filter(Patient.id.in_(patient_ids)).all() if patient_ids else []
+
+        return jsonify({
+            'success': True,
+            'patients': [p.to_dict() for p in patients],
+            'missing': sorted(patient_ids - {p.id for p in patients})
+        }), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/patients/<int:patient_id>', methods=['GET'])
 def get_patient(patient_id):
     """Récupérer un patient par ID"""
@@ -112,28 +497,19 @@ def create_patient():
         data = request.get_json()
         
         # Validation
-        required_fields = ['first_name', 'last_name', 'email', 'phone', 'date_of_birth', 'gender']
-        for field in required_fields:
+        for field in REQUIRED_PATIENT_FIELDS:
             if field not in data:
                 return jsonify({'success': False, 'error': f'{field} est requis'}), 400
         
+        if not isinstance(data['email'], str):
+            return jsonify({'success': False, 'error': 'email doit être une chaîne de caractères'}), 400
+        
         # Vérifier si l'email existe déjà
-        if Patient.query.filter_by(email=data['email']).first():
+        if find_patient_by_email(data['email']):
             return jsonify({'success': False, 'error': 'Email déjà utilisé'}), 400
         
         # Créer le patient
-        patient = Patient(
-            first_name=data['first_name'],
-            last_name=data['last_name'],
-            email=data['email'],
-            phone=data['phone'],
-            date_of_birth=datetime.strptime(data['date_of_birth'], '%Y-%m-%d'),
-            gender=data['gender'],
-            address=data.get('address'),
-            blood_group=data.get('blood_group'),
-            allergies=data.get('allergies'),
-            medical_history=data.get('medical_history')
-        )
+        patient = patient_from_data(data)
         
         db.session.add(patient)
         db.session.commit()
@@ -148,6 +524,111 @@ def create_patient():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/patients/by-email', methods=['GET'])
+def get_patient_by_email():
+    """Récupérer un patient par email exact, sans tenir compte de la casse (recherche indexée)"""
+    try:
+        email = request.args.get('email', '').strip()
+        if not email:
+            return jsonify({'success': False, 'error': 'email est requis'}), 400
+        
+        patient = find_patient_by_email(email)
+        if not patient:
+            return jsonify({'success': False, 'error': 'Patient non trouvé'}), 404
+        
+        return jsonify({'success': True, 'patient': patient.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/patients/get-or-create', methods=['POST'])
+def get_or_create_patient():
+    """Retourner le patient ayant cet email, ou le créer s'il n'existe pas"""
+    try:
+        data = request.get_json()
+        
+        # Validation
+        for field in REQUIRED_PATIENT_FIELDS:
+            if field not in data:
+                return jsonify({'success': False, 'error': f'{field} est requis'}), 400
+        if not isinstance(data['email'], str):
+            return jsonify({'success': False, 'error': 'email doit être une chaîne de caractères'}), 400
+        
+        patient = find_patient_by_email(data['email'])
+        if patient:
+            return jsonify({'success': True, 'created': False, 'patient': patient.to_dict()}), 200
+        
+        try:
+            patient = patient_from_data(data)
+            db.session.add(patient)
+            db.session.commit()
+        except IntegrityError:
+            # Créé entre-temps par une requête concurrente: retourner celui-ci
+            db.session.rollback()
+            patient = find_patient_by_email(data['email'])
+            if not patient:
+                raise
+            return jsonify({'success': True, 'created': False, 'patient': patient.to_dict()}), 200
+        
+        return jsonify({
+            'success': True,
+            'created': True,
+            'message': 'Patient créé avec succès',
+            'patient': patient.to_dict()
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/patients/import', methods=['POST'])
+def import_patients():
+    """Importer des patients en masse depuis un corps CSV ou NDJSON (lu en streaming)"""
+    try:
+        # Format via ?format=csv|ndjson, sinon déduit du Content-Type
+        file_format = request.args.get('format')
+        if not file_format:
+            file_format = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+        if file_format not in ('csv', 'ndjson'):
+            return jsonify({'success': False, 'error': 'format doit être csv ou ndjson'}), 400
+        
+        report = {'imported': 0, 'failed': 0, 'errors': [], 'errors_truncated': False, 'aborted_at_line': None}
+        seen_emails = set()
+        chunk = []
+        
+        try:
+            for line_number, row in iter_import_rows(request.stream, file_format):
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    values = validate_import_row(row)
+                    if values['email'] in seen_emails:
+                        raise ValueError('Email en double dans le fichier')
+                except ValueError as e:
+                    add_import_error(report, line_number, str(e))
+                    continue
+                
+                seen_emails.add(values['email'])
+                chunk.append((line_number, values))
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    insert_import_chunk(chunk, report)
+                    chunk = []
+        except ImportStreamError as e:
+            # Les lignes précédentes sont importées, la suite du fichier est ignorée
+            add_import_error(report, e.line_number, str(e))
+            report['aborted_at_line'] = e.line_number
+        
+        if chunk:
+            insert_import_chunk(chunk, report)
+        
+        report['errors'].sort(key=lambda error: error['line'])
+        
+        return jsonify({'success': report['failed'] == 0, **report}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/patients/<int:patient_id>', methods=['PUT'])
 def update_patient(patient_id):
     """Mettre à jour un patient"""
@@ -161,11 +642,13 @@ def update_patient(patient_id):
         if 'last_name' in data:
             patient.last_name = data['last_name']
         if 'email' in data:
+            if not isinstance(data['email'], str):
+                return jsonify({'success': False, 'error': 'email doit être une chaîne de caractères'}), 400
             # Vérifier si le nouvel email est déjà utilisé
-            existing = Patient.query.filter_by(email=data['email']).first()
+            existing = find_patient_by_email(data['email'])
             if existing and existing.id != patient_id:
                 return jsonify({'success': False, 'error': 'Email déjà utilisé'}), 400
-            patient.email = data['email']
+            patient.email = normalize_email(data['email'])
         if 'phone' in data:
             patient.phone = data['phone']
         if 'date_of_birth' in data:
@@ -212,17 +695,20 @@ def delete_patient(patient_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/patients/stats', methods=['GET'])
+@stats_cache.cached_response
 def get_patient_stats():
     """Obtenir les statistiques des patients"""
     try:
-        total_patients = Patient.query.count()
-        male_patients = Patient.query.filter_by(gender='Homme').count()
-        female_patients = Patient.query.filter_by(gender='Femme').count()
-        
         # Nouveaux patients ce mois
-        from datetime import datetime, timedelta
         first_day = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        new_this_month = Patient.query.filter(Patient.created_at >= first_day).count()
+        
+        # Tous les compteurs en une seule passe sur la table
+        total_patients, male_patients, female_patients, new_this_month = db.session.query(
+            func.count(Patient.id),
+            count_where(Patient.gender == 'Homme'),
+            count_where(Patient.gender == 'Femme'),
+            count_where(Patient.created_at >= first_day)
+        ).one()
         
         return jsonify({
             'success': True,
@@ -237,10 +723,19 @@ def get_patient_stats():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CLI ====================
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Ajouter les index manquants à une base existante"""
+    create_missing_indexes()
+    print("✅ Index créés")
+
 # ==================== MAIN ====================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_indexes()
+        setup_search_index()
         print("✅ Database tables created successfully!")
     
     port = int(os.getenv('PORT', 5002))
@@ -0,0 +1,257 @@
+# Instrumentation des requêtes HTTP: durée totale, requêtes SQL et appels
+# HTTP sortants. Fichier identique dans chaque service (chaque image Docker
+# est construite à partir du dossier du service).
+#
+# Chaque réponse porte un en-tête Server-Timing (app, db, http) et les
+# compteurs cumulés sont exposés au format texte Prometheus par /metrics.
+#
+# Détection des régressions: les requêtes SQL plus lentes que SLOW_QUERY_MS
+# sont journalisées avec leurs paramètres et la route appelante, et une
+# requête HTTP qui exécute la même instruction SQL (ou le même appel à un
+# autre service) plus de REPEATED_QUERY_THRESHOLD fois est signalée comme
+# N+1 (exception RepeatedQueriesError si QUERY_ALERTS_RAISE=1, pour les tests).
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Bornes (en secondes) de l'histogramme des durées de requête
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Seuils de détection (0 désactive)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+REPEATED_QUERY_THRESHOLD = int(os.getenv('REPEATED_QUERY_THRESHOLD', 10))
+QUERY_ALERTS_RAISE = os.getenv('QUERY_ALERTS_RAISE', '0') == '1'
+
+logger = logging.getLogger('instrumentation')
+
+# Mesures de la requête en cours (visibles aussi dans les threads lancés
+# avec contextvars.copy_context().run)
+_current = ContextVar('request_timings', default=None)
+
+
+class RepeatedQueriesError(AssertionError):
+    """Même instruction SQL (ou même appel sortant) répétée dans une requête"""
+
+
+def statement_shape(statement):
+    """Forme d'une instruction SQL: espaces et listes IN (?, ?, ...) normalisés"""
+    shape = re.sub(r'\s+', ' ', statement).strip()
+    return re.sub(r'\((?:\s*(?:\?|%\(\w+\)s|%s)\s*,)+\s*(?:\?|%\(\w+\)s|%s)\s*\)', '(?)', shape)
+
+
+def call_shape(method, url):
+    """Forme d'un appel sortant: sans paramètres, ids numériques remplacés"""
+    path = re.sub(r'/\d+(?=/|$)', '/<id>', url.split('?', 1)[0])
+    return f'{method} {path}'
+
+
+class RequestTimings:
+    """Compteurs d'une requête: SQL et appels HTTP sortants"""
+
+    def __init__(self, route=None):
+        self.route = route
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.slow_queries = 0
+        self.http_count = 0
+        self.http_ms = 0.0
+        self.statements = Counter()
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def add_sql(self, elapsed_ms, statement, slow=False):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_ms += elapsed_ms
+            self.slow_queries += 1 if slow else 0
+            self.statements[statement_shape(statement)] += 1
+
+    def add_http(self, elapsed_ms, shape=None):
+        with self._lock:
+            self.http_count += 1
+            self.http_ms += elapsed_ms
+            if shape:
+                self.calls[shape] += 1
+
+    def repeated(self, threshold):
+        """Instructions SQL et appels sortants exécutés plus de `threshold` fois"""
+        with self._lock:
+            return ([('sql', shape, count) for shape, count in self.statements.items() if count > threshold] +
+                    [('http', shape, count) for shape, count in self.calls.items() if count > threshold])
+
+
+def current_timings():
+    """Mesures de la requête en cours, ou None hors requête"""
+    return _current.get()
+
+
+def record_http_call(elapsed_ms, method=None, url=None):
+    """Comptabiliser un appel HTTP sortant dans la requête en cours"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add_http(elapsed_ms, call_shape(method, url) if url else None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+    slow = 0 < SLOW_QUERY_MS <= elapsed_ms
+    timings = _current.get()
+    if timings is not None:
+        timings.add_sql(elapsed_ms, statement, slow)
+    if slow:
+        logger.warning(
+            'Requête SQL lente (%.1f ms) sur %s: %s | paramètres: %.500r',
+            elapsed_ms, timings.route if timings else 'hors requête', statement, parameters
+        )
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # after_cursor_execute n'est pas appelé pour une instruction en erreur:
+    # retirer son horodatage, sinon il reste sur la connexion (réutilisée par le pool)
+    conn = exception_context.connection
+    if conn is not None and exception_context.execution_context is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+class Instrumentation:
+    """Métriques par endpoint d'un service Flask
+
+    `init_app` mesure chaque requête, ajoute l'en-tête Server-Timing et
+    signale les instructions répétées; `metrics_response` rend les
+    compteurs au format Prometheus.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.repeated_threshold = REPEATED_QUERY_THRESHOLD
+        self.raise_on_repeated = QUERY_ALERTS_RAISE
+        self._lock = threading.Lock()
+        self._requests = {}   # (méthode, endpoint, statut) -> nombre
+        self._endpoints = {}  # (méthode, endpoint) -> cumuls et histogramme
+
+    def init_app(self, app):
+        @app.before_request
+        def start_request_timings():
+            g.request_timings = RequestTimings(f'{request.method} {request.path}')
+            g.request_timings_token = _current.set(g.request_timings)
+
+        @app.after_request
+        def record_request_timings(response):
+            timings = g.get('request_timings')
+            if timings is None:
+                return response
+            total_ms = (time.perf_counter() - timings.start) * 1000
+            response.headers['Server-Timing'] = (
+                f'app;dur={total_ms:.2f}, '
+                f'db;desc="{timings.sql_count} queries";dur={timings.sql_ms:.2f}, '
+                f'http;desc="{timings.http_count} calls";dur={timings.http_ms:.2f}'
+            )
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            repeated = timings.repeated(self.repeated_threshold) if self.repeated_threshold > 0 else []
+            self.observe(request.method, endpoint, response.status_code, total_ms, timings, len(repeated))
+
+            if repeated:
+                details = '; '.join(f'{kind} x{count}: {shape[:300]}' for kind, shape, count in repeated)
+                logger.warning('N+1 probable sur %s: %s', timings.route, details)
+                if self.raise_on_repeated:
+                    raise RepeatedQueriesError(f'N+1 sur {timings.route}: {details}')
+            return response
+
+        @app.teardown_request
+        def reset_request_timings(exc):
+            token = g.pop('request_timings_token', None)
+            if token is not None:
+                _current.reset(token)
+
+    def observe(self, method, endpoint, status, total_ms, timings, repeated=0):
+        with self._lock:
+            key = (method, endpoint, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            stats = self._endpoints.get((method, endpoint))
+            if stats is None:
+                stats = {
+                    'buckets': [0] * len(DURATION_BUCKETS),
+                    'count': 0, 'seconds': 0.0,
+                    'sql_count': 0, 'sql_seconds': 0.0, 'slow_queries': 0,
+                    'http_count': 0, 'http_seconds': 0.0, 'repeated': 0
+                }
+                self._endpoints[(method, endpoint)] = stats
+
+            seconds = total_ms / 1000
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['sql_count'] += timings.sql_count
+            stats['sql_seconds'] += timings.sql_ms / 1000
+            stats['slow_queries'] += timings.slow_queries
+            stats['repeated'] += 1 if repeated else 0
+            stats['http_count'] += timings.http_count
+            stats['http_seconds'] += timings.http_ms / 1000
+
+    def render(self):
+        """Compteurs au format d'exposition texte de Prometheus"""
+        with self._lock:
+            requests_total = sorted(self._requests.items())
+            endpoints = sorted((key, dict(stats, buckets=list(stats['buckets'])))
+                               for key, stats in self._endpoints.items())
+
+        def labels(method, endpoint, **extra):
+            pairs = [('service', self.service), ('method', method), ('endpoint', endpoint)] + list(extra.items())
+            return ','.join(f'{name}="{value}"' for name, value in pairs)
+
+        lines = [
+            '# HELP http_requests_total Requêtes HTTP traitées',
+            '# TYPE http_requests_total counter'
+        ]
+        for (method, endpoint, status), count in requests_total:
+            lines.append(f'http_requests_total{{{labels(method, endpoint, status=status)}}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Durée des requêtes HTTP',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for (method, endpoint), stats in endpoints:
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels(method, endpoint, le=bound)}}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels(method, endpoint, le="+Inf")}}} {stats["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels(method, endpoint)}}} {stats["seconds"]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels(method, endpoint)}}} {stats["count"]}')
+
+        for name, field, kind, help_text in (
+            ('db_queries_total', 'sql_count', 'counter', 'Requêtes SQL exécutées'),
+            ('db_query_duration_seconds_total', 'sql_seconds', 'counter', 'Temps passé en SQL'),
+            ('db_slow_queries_total', 'slow_queries', 'counter', 'Requêtes SQL au-delà de SLOW_QUERY_MS'),
+            ('db_repeated_queries_requests_total', 'repeated', 'counter', 'Requêtes HTTP avec N+1 détecté'),
+            ('http_client_requests_total', 'http_count', 'counter', 'Appels HTTP vers les autres services'),
+            ('http_client_duration_seconds_total', 'http_seconds', 'counter', 'Temps passé en appels HTTP sortants'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for (method, endpoint), stats in endpoints:
+                value = stats[field]
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{{labels(method, endpoint)}}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def metrics_response(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
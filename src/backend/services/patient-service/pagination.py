@@ -0,0 +1,79 @@
+# Pagination par curseur (keyset) pour les endpoints de liste.
+# Fichier identique dans chaque service (chaque image Docker est construite
+# à partir du dossier du service).
+#
+# Mode optionnel: ?cursor=&limit=20 pour la première page, puis
+# ?cursor=<next_cursor>&limit=20. Contrairement à page/per_page, aucun
+# COUNT(*) n'est exécuté et la page suivante est trouvée par l'index
+# (WHERE tri < dernière valeur) au lieu d'un OFFSET.
+
+import base64
+import json
+from datetime import date, datetime
+
+from flask import request
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    """Curseur illisible ou ne correspondant pas à la colonne de tri"""
+
+
+def cursor_requested():
+    """Le client a-t-il demandé le mode curseur ?"""
+    return 'cursor' in request.args
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    payload = json.dumps([value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, column):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        python_type = column.type.python_type
+        if python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif python_type is date:
+            value = date.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        raise InvalidCursor(f'Curseur invalide: {e}')
+
+
+def keyset_paginate(query, column, id_column, descending=True):
+    """Paginer `query` par curseur sur (column, id)
+
+    Retourne (éléments, infos de page) où les infos contiennent
+    `next_cursor` (None sur la dernière page) et `limit`.
+    """
+    limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
+    cursor = request.args.get('cursor')
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, column)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, id_column < last_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, id_column > last_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(getattr(last, column.key), getattr(last, id_column.key))
+
+    return rows[:limit], {'next_cursor': next_cursor, 'limit': limit}
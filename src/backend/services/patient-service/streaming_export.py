@@ -0,0 +1,60 @@
+# Export en streaming (CSV / NDJSON) d'une requête SQLAlchemy.
+# Fichier identique dans chaque service qui propose un export (chaque image
+# Docker est construite à partir du dossier du service).
+#
+# Les lignes sont lues par paquets avec yield_per (curseur côté serveur sous
+# PostgreSQL) et envoyées au client au fur et à mesure: la mémoire utilisée
+# ne dépend pas du nombre de lignes exportées.
+
+import csv
+import io
+import json
+import os
+
+from flask import Response, stream_with_context
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def generate_csv(rows, batch_size):
+    buffer = io.StringIO()
+    writer = None
+    for count, row in enumerate(rows, start=1):
+        data = row.to_dict()
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(data.keys()))
+            writer.writeheader()
+        writer.writerow(data)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def generate_ndjson(rows, batch_size):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row.to_dict(), ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_response(query, file_format, filename):
+    """Réponse HTTP streamée exportant toutes les lignes de `query` (via to_dict)"""
+    rows = query.yield_per(EXPORT_BATCH_SIZE)
+    generate = generate_csv if file_format == 'csv' else generate_ndjson
+    return Response(
+        stream_with_context(generate(rows, EXPORT_BATCH_SIZE)),
+        mimetype=EXPORT_FORMATS[file_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{file_format}'}
+    )
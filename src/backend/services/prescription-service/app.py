@@ -2,9 +2,19 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
 import os
-import requests
+import threading
+from service_client import get_client, clients_stats
+from stats_cache import StatsCache
+from medicine_cache import MedicineCache
+from instrumentation import Instrumentation
+from jwt_auth import JWTAuth
+from pagination import cursor_requested, keyset_paginate, InvalidCursor
 
 app = Flask(__name__)
 CORS(app)
@@ -16,22 +26,74 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Cache des statistiques (vidé à chaque écriture)
+stats_cache = StatsCache(
+    ttl=float(os.getenv('STATS_CACHE_TTL', 5)),
+    max_size=int(os.getenv('STATS_CACHE_MAX_SIZE', 128))
+)
+stats_cache.init_app(app)
+
+# Mesures par requête (en-tête Server-Timing et endpoint /metrics)
+instrumentation = Instrumentation('prescription-service')
+instrumentation.init_app(app)
+
+# Vérification locale des jetons de l'auth-service (JWT_AUTH_MODE: off, optional, required)
+jwt_auth = JWTAuth()
+jwt_auth.init_app(app)
+
 # URLs des autres services
 PATIENT_SERVICE_URL = os.getenv('PATIENT_SERVICE_URL', 'http://localhost:5002')
 MEDICINE_SERVICE_URL = os.getenv('MEDICINE_SERVICE_URL', 'http://localhost:5005')
 
+# Clients HTTP partagés (pool de connexions, timeouts, retries)
+patient_service = get_client(PATIENT_SERVICE_URL, name='patient-service')
+medicine_service = get_client(MEDICINE_SERVICE_URL, name='medicine-service')
+
+# Nombre d'IDs par appel à /api/patients/batch (MAX_BATCH_SIZE du patient-service)
+PATIENT_BATCH_SIZE = int(os.getenv('PATIENT_BATCH_SIZE', 500))
+
+# Durée (en heures) des réservations de stock prises à la création d'une ordonnance
+STOCK_RESERVATION_TTL_HOURS = float(os.getenv('STOCK_RESERVATION_TTL_HOURS', 72))
+
+# Délai maximum (en secondes) pour enrichir une ordonnance avec les autres services
+ENRICHMENT_TIMEOUT = float(os.getenv('ENRICHMENT_TIMEOUT', 3))
+
+# Cache local des fiches médicaments (invalidé par le flux de changements du medicine-service)
+medicine_cache = MedicineCache(
+    ttl=float(os.getenv('MEDICINE_CACHE_TTL', 300)),
+    max_size=int(os.getenv('MEDICINE_CACHE_MAX_SIZE', 5000))
+)
+
+# Intervalle (en secondes) de lecture des changements de médicaments (0: TTL seul)
+MEDICINE_CACHE_SYNC_INTERVAL = float(os.getenv('MEDICINE_CACHE_SYNC_INTERVAL', 5))
+
+# Recouvrement (en secondes) entre deux lectures, pour les écritures commitées en retard
+MEDICINE_CHANGES_OVERLAP = 5
+
+# Pool partagé pour paralléliser les appels aux autres services
+enrichment_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ENRICHMENT_WORKERS', 8)),
+    thread_name_prefix='enrichment'
+)
+
 # ==================== MODELS ====================
 class Prescription(db.Model):
     __tablename__ = 'prescriptions'
+    __table_args__ = (
+        # Ordonnances d'un patient, triées par date
+        db.Index('ix_prescriptions_patient_date', 'patient_id', 'prescription_date'),
+        # Ordonnances actives qui expirent bientôt
+        db.Index('ix_prescriptions_status_valid_until', 'status', 'valid_until'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, nullable=False)
     doctor_name = db.Column(db.String(100), nullable=False)
     diagnosis = db.Column(db.String(200), nullable=False)
     notes = db.Column(db.Text)
-    prescription_date = db.Column(db.DateTime, default=datetime.utcnow)
-    valid_until = db.Column(db.DateTime)
-    status = db.Column(db.String(20), default='active')  # active, expired, cancelled
+    prescription_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    valid_until = db.Column(db.DateTime, index=True)
+    status = db.Column(db.String(20), default='active')  # active, dispensed, expired, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -60,7 +122,7 @@ class PrescriptionMedication(db.Model):
     __tablename__ = 'prescription_medications'
     
     id = db.Column(db.Integer, primary_key=True)
-    prescription_id = db.Column(db.Integer, db.ForeignKey('prescriptions.id'), nullable=False)
+    prescription_id = db.Column(db.Integer, db.ForeignKey('prescriptions.id'), nullable=False, index=True)
     medicine_id = db.Column(db.Integer, nullable=False)  # ID du médicament dans medicine-service
     medicine_name = db.Column(db.String(100), nullable=False)  # Cache du nom
     dosage = db.Column(db.String(50), nullable=False)  # ex: "500mg"
@@ -85,7 +147,7 @@ class PrescriptionMedication(db.Model):
 def get_patient_info(patient_id):
     """Récupérer les infos d'un patient"""
     try:
-        response = requests.get(f"{PATIENT_SERVICE_URL}/api/patients/{patient_id}")
+        response = patient_service.get(f"/api/patients/{patient_id}")
         if response.status_code == 200:
             return response.json().get('patient')
         return None
@@ -93,34 +155,189 @@ def get_patient_info(patient_id):
         print(f"Erreur récupération patient: {e}")
         return None
 
+def get_patients_info(patient_ids):
+    """Récupérer plusieurs patients en un seul appel au patient-service
+
+    Retourne un dictionnaire {patient_id: patient}. Les IDs sont envoyés par
+    paquets de PATIENT_BATCH_SIZE (limite de /api/patients/batch).
+    """
+    patient_ids = sorted(set(patient_ids))
+    patients = {}
+    try:
+        for start in range(0, len(patient_ids), PATIENT_BATCH_SIZE):
+            chunk = patient_ids[start:start + PATIENT_BATCH_SIZE]
+            response = patient_service.get(
+                "/api/patients/batch",
+                params={'ids': ','.join(str(i) for i in chunk)}
+            )
+            if response.status_code == 200:
+                patients.update({p['id']: p for p in response.json().get('patients', [])})
+    except Exception as e:
+        print(f"Erreur récupération patients: {e}")
+    return patients
+
 def get_medicine_info(medicine_id):
-    """Récupérer les infos d'un médicament"""
+    """Récupérer les infos d'un médicament (via le cache local)"""
+    generation = medicine_cache.generation()
+    medicine = medicine_cache.get(medicine_id)
+    if medicine is not None:
+        return medicine
     try:
-        response = requests.get(f"{MEDICINE_SERVICE_URL}/api/medicines/{medicine_id}")
+        response = medicine_service.get(f"/api/medicines/{medicine_id}")
         if response.status_code == 200:
-            return response.json().get('medicine')
+            medicine = response.json().get('medicine')
+            if medicine:
+                medicine_cache.set_many({medicine['id']: medicine}, generation)
+            return medicine
         return None
     except Exception as e:
         print(f"Erreur récupération médicament: {e}")
         return None
 
-def check_medicine_stock(medicine_id, quantity):
-    """Vérifier le stock d'un médicament"""
+def get_medicines_info(medicine_ids):
+    """Récupérer plusieurs médicaments (cache local, puis un seul appel pour les absents)
+
+    Retourne un dictionnaire {medicine_id: medicine}.
+    """
+    generation = medicine_cache.generation()
+    medicines, missing = medicine_cache.get_many(sorted(set(medicine_ids)))
+    if not missing:
+        return medicines
     try:
-        response = requests.get(f"{MEDICINE_SERVICE_URL}/api/medicines/{medicine_id}/stock")
+        response = medicine_service.get(
+            "/api/medicines/batch",
+            params={'ids': ','.join(str(i) for i in missing)}
+        )
         if response.status_code == 200:
-            stock = response.json().get('stock', 0)
-            return stock >= quantity
+            fetched = {m['id']: m for m in response.json().get('medicines', [])}
+            medicine_cache.set_many(fetched, generation)
+            medicines.update(fetched)
+    except Exception as e:
+        print(f"Erreur récupération médicaments: {e}")
+    return medicines
+
+def sync_medicine_cache():
+    """Retirer du cache les médicaments modifiés ou supprimés depuis la dernière synchronisation
+
+    Un seul appel à /api/medicines/changes; à la première synchronisation
+    (ou si la précédente est inconnue), le cache est vidé.
+    """
+    params = {}
+    if medicine_cache.synced_at:
+        since = datetime.fromisoformat(medicine_cache.synced_at) - timedelta(seconds=MEDICINE_CHANGES_OVERLAP)
+        params['since'] = since.isoformat()
+    try:
+        response = medicine_service.get("/api/medicines/changes", params=params)
+        if response.status_code != 200:
+            return False
+        data = response.json()
+        if params:
+            medicine_cache.invalidate(data.get('changed', []) + data.get('deleted', []))
+        else:
+            medicine_cache.clear()
+        medicine_cache.synced_at = data['as_of']
+        return True
+    except Exception as e:
+        print(f"Erreur synchronisation cache médicaments: {e}")
         return False
+
+def run_medicine_cache_sync(stop_event):
+    """Boucle de fond: applique les changements de médicaments à intervalle régulier"""
+    while True:
+        sync_medicine_cache()
+        if stop_event.wait(MEDICINE_CACHE_SYNC_INTERVAL):
+            break
+
+def start_medicine_cache_sync():
+    """Démarrer le thread de synchronisation du cache des médicaments"""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_medicine_cache_sync,
+        args=(stop_event,),
+        name='medicine-cache-sync',
+        daemon=True
+    )
+    thread.start()
+    return stop_event
+
+def create_missing_indexes():
+    """Créer sur une base existante les index déclarés dans les modèles
+
+    db.create_all() ne modifie pas les tables déjà créées: cette fonction
+    ajoute les index manquants (CREATE INDEX, ignoré s'il existe déjà).
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def count_rows(model, *conditions):
+    """COUNT(*) en sous-requête scalaire: chaque compteur est calculé sur son propre index
+
+    Toutes les colonnes filtrées par les statistiques de ce service sont
+    indexées: plusieurs COUNT limités à l'index sont bien plus rapides qu'un
+    seul SUM(CASE ...) qui parcourt la table (voir scripts/benchmark_stats.py).
+    Les sous-requêtes sont réunies dans un seul SELECT (un aller-retour).
+    """
+    return db.select(func.count()).select_from(model).where(*conditions).scalar_subquery()
+
+def stock_reference(prescription):
+    """Référence de la réservation de stock d'une ordonnance dans le medicine-service
+
+    La date de création évite qu'un ID réutilisé (SQLite) retombe sur une ancienne réservation.
+    """
+    return f"prescription-{prescription.id}-{prescription.created_at:%Y%m%d%H%M%S}"
+
+def medication_totals(medications):
+    """Quantités par médicament: [{medicine_id, quantity}] pour le medicine-service"""
+    totals = {}
+    for med in medications:
+        totals[med.medicine_id] = totals.get(med.medicine_id, 0) + (med.quantity or 1)
+    return [{'medicine_id': m, 'quantity': q} for m, q in sorted(totals.items())]
+
+def reserve_prescription_stock(prescription, user=None):
+    """Réserver le stock de toutes les lignes d'une ordonnance en un seul appel
+
+    Retourne la réponse du medicine-service, ou None s'il est injoignable.
+    """
+    try:
+        return medicine_service.post("/api/reservations", json={
+            'reference': stock_reference(prescription),
+            'items': medication_totals(prescription.medications),
+            'ttl_hours': STOCK_RESERVATION_TTL_HOURS,
+            'user': user
+        })
+    except Exception as e:
+        print(f"Erreur réservation stock: {e}")
+        return None
+
+def release_prescription_stock(reference):
+    """Libérer une réservation de stock (sans effet si elle n'existe pas)"""
+    try:
+        response = medicine_service.post(f"/api/reservations/{reference}/release")
+        return response.status_code in (200, 404)
     except Exception as e:
-        print(f"Erreur vérification stock: {e}")
+        print(f"Erreur libération stock: {e}")
         return False
 
 # ==================== ROUTES ====================
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'prescription-service'}), 200
+    return jsonify({'status': 'healthy', 'service': 'prescription-service', 'auth': jwt_auth.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus"""
+    return instrumentation.metrics_response()
+
+@app.route('/health/upstreams', methods=['GET'])
+def upstreams_health():
+    """Métriques des appels vers les autres services"""
+    return jsonify({
+        'success': True,
+        'upstreams': clients_stats(),
+        'medicine_cache': medicine_cache.stats()
+    }), 200
 
 @app.route('/api/prescriptions', methods=['GET'])
 def get_prescriptions():
@@ -131,7 +348,8 @@ def get_prescriptions():
         status = request.args.get('status')
         patient_id = request.args.get('patient_id', type=int)
         
-        query = Prescription.query
+        # Médicaments chargés en une requête pour toute la page (pas de N+1 dans to_dict)
+        query = Prescription.query.options(selectinload(Prescription.medications))
         
         # Filtrer par statut
         if status:
@@ -141,16 +359,22 @@ def get_prescriptions():
         if patient_id:
             query = query.filter_by(patient_id=patient_id)
         
-        # Pagination
-        pagination = query.order_by(Prescription.prescription_date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Pagination (par curseur si demandé, sinon page/per_page)
+        if cursor_requested():
+            items, page_info = keyset_paginate(query, Prescription.prescription_date, Prescription.id)
+        else:
+            pagination = query.order_by(Prescription.prescription_date.desc()).paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            items = pagination.items
+            page_info = {'total': pagination.total, 'pages': pagination.pages, 'current_page': page}
         
-        # Enrichir avec les données patients
+        # Enrichir avec les données patients (un seul appel pour la page)
+        patients = get_patients_info(pres.patient_id for pres in items)
         prescriptions = []
-        for pres in pagination.items:
+        for pres in items:
             pres_dict = pres.to_dict()
-            patient = get_patient_info(pres.patient_id)
+            patient = patients.get(pres.patient_id)
             if patient:
                 pres_dict['patient'] = {
                     'name': f"{patient['first_name']} {patient['last_name']}",
@@ -161,11 +385,11 @@ def get_prescriptions():
         return jsonify({
             'success': True,
             'prescriptions': prescriptions,
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': page
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -176,17 +400,31 @@ def get_prescription(prescription_id):
         prescription = Prescription.query.get_or_404(prescription_id)
         pres_dict = prescription.to_dict()
         
+        # Récupérer le patient et les médicaments en parallèle, avec un délai maximum
+        # (copy_context: les appels restent comptés dans les mesures de la requête)
+        patient_future = enrichment_executor.submit(
+            copy_context().run, get_patient_info, prescription.patient_id
+        )
+        medicines_future = enrichment_executor.submit(
+            copy_context().run, get_medicines_info, [med['medicine_id'] for med in pres_dict['medications']]
+        )
+        done, _ = wait([patient_future, medicines_future], timeout=ENRICHMENT_TIMEOUT)
+        
         # Ajouter les infos du patient
-        patient = get_patient_info(prescription.patient_id)
+        patient = patient_future.result() if patient_future in done else None
         if patient:
             pres_dict['patient'] = patient
         
         # Enrichir les médicaments avec les détails complets
+        medicines = medicines_future.result() if medicines_future in done else {}
         for med in pres_dict['medications']:
-            medicine = get_medicine_info(med['medicine_id'])
+            medicine = medicines.get(med['medicine_id'])
             if medicine:
                 med['medicine_details'] = medicine
         
+        if len(done) < 2:
+            print(f"⚠️ Enrichissement incomplet de l'ordonnance {prescription_id} (délai dépassé)")
+        
         return jsonify({'success': True, 'prescription': pres_dict}), 200
         
     except Exception as e:
@@ -207,11 +445,34 @@ def create_prescription():
         if not isinstance(data['medications'], list) or len(data['medications']) == 0:
             return jsonify({'success': False, 'error': 'Au moins un médicament requis'}), 400
         
+        # Validation des champs médicament
+        required_med_fields = ['medicine_id', 'dosage', 'frequency', 'duration']
+        for med_data in data['medications']:
+            if not isinstance(med_data, dict):
+                return jsonify({'success': False, 'error': 'Chaque médicament doit être un objet'}), 400
+            for field in required_med_fields:
+                if field not in med_data:
+                    return jsonify({'success': False, 'error': f'{field} requis pour chaque médicament'}), 400
+            # IDs et quantités convertis une fois pour toutes ("1" et 1 désignent le même médicament)
+            try:
+                med_data['medicine_id'] = int(med_data['medicine_id'])
+                med_data['quantity'] = int(med_data.get('quantity', 1))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': 'medicine_id et quantity doivent être des entiers'}), 400
+            if med_data['quantity'] <= 0:
+                return jsonify({'success': False, 'error': 'quantity doit être positive'}), 400
+        
         # Vérifier que le patient existe
         patient = get_patient_info(data['patient_id'])
         if not patient:
             return jsonify({'success': False, 'error': 'Patient non trouvé'}), 404
         
+        # Récupérer tous les médicaments en un seul appel
+        medicines = get_medicines_info(med_data['medicine_id'] for med_data in data['medications'])
+        for med_data in data['medications']:
+            if med_data['medicine_id'] not in medicines:
+                return jsonify({'success': False, 'error': f'Médicament {med_data["medicine_id"]} non trouvé'}), 404
+        
         # Calculer la date de validité (30 jours par défaut)
         valid_until = datetime.utcnow() + timedelta(days=data.get('validity_days', 30))
         
@@ -226,42 +487,41 @@ def create_prescription():
         )
         
         db.session.add(prescription)
-        db.session.flush()  # Pour obtenir l'ID
+        db.session.flush()  # Pour obtenir l'ID et la date de création
         
         # Ajouter les médicaments
         for med_data in data['medications']:
-            # Validation des champs médicament
-            required_med_fields = ['medicine_id', 'dosage', 'frequency', 'duration']
-            for field in required_med_fields:
-                if field not in med_data:
-                    db.session.rollback()
-                    return jsonify({'success': False, 'error': f'{field} requis pour chaque médicament'}), 400
-            
-            # Récupérer le nom du médicament
-            medicine = get_medicine_info(med_data['medicine_id'])
-            if not medicine:
-                db.session.rollback()
-                return jsonify({'success': False, 'error': f'Médicament {med_data["medicine_id"]} non trouvé'}), 404
-            
-            # Vérifier le stock (optionnel)
-            quantity = med_data.get('quantity', 1)
-            if not check_medicine_stock(med_data['medicine_id'], quantity):
-                print(f"⚠️ Stock insuffisant pour {medicine['name']}")
-            
-            # Ajouter le médicament à l'ordonnance
             pres_med = PrescriptionMedication(
                 prescription_id=prescription.id,
                 medicine_id=med_data['medicine_id'],
-                medicine_name=medicine['name'],
+                medicine_name=medicines[med_data['medicine_id']]['name'],
                 dosage=med_data['dosage'],
                 frequency=med_data['frequency'],
                 duration=med_data['duration'],
                 instructions=med_data.get('instructions'),
-                quantity=quantity
+                quantity=med_data['quantity']
             )
-            db.session.add(pres_med)
+            prescription.medications.append(pres_med)
         
-        db.session.commit()
+        # Réserver le stock de toutes les lignes (un seul appel, tout ou rien)
+        reserved = False
+        if data.get('reserve_stock', True):
+            response = reserve_prescription_stock(prescription, user=data['doctor_name'])
+            if response is None or response.status_code >= 500:
+                db.session.rollback()
+                return jsonify({'success': False, 'error': 'Réservation du stock impossible (medicine-service indisponible)'}), 503
+            if response.status_code not in (200, 201):
+                db.session.rollback()
+                return jsonify({'success': False, **response.json()}), response.status_code
+            reserved = True
+        
+        reference = stock_reference(prescription)
+        try:
+            db.session.commit()
+        except Exception:
+            if reserved:
+                release_prescription_stock(reference)
+            raise
         
         return jsonify({
             'success': True,
@@ -287,7 +547,15 @@ def update_prescription(prescription_id):
             prescription.diagnosis = data['diagnosis']
         if 'notes' in data:
             prescription.notes = data['notes']
+        previous_status = prescription.status
         if 'status' in data:
+            # La dispensation consomme la réservation de stock: elle passe
+            # uniquement par POST /api/prescriptions/<id>/dispense
+            if data['status'] == 'dispensed' and previous_status != 'dispensed':
+                return jsonify({
+                    'success': False,
+                    'error': 'Utiliser POST /api/prescriptions/<id>/dispense pour dispenser une ordonnance'
+                }), 409
             prescription.status = data['status']
         if 'valid_until' in data:
             prescription.valid_until = datetime.strptime(data['valid_until'], '%Y-%m-%d')
@@ -295,6 +563,10 @@ def update_prescription(prescription_id):
         prescription.updated_at = datetime.utcnow()
         db.session.commit()
         
+        # Ordonnance annulée ou expirée: rendre le stock réservé
+        if previous_status == 'active' and prescription.status in ('cancelled', 'expired'):
+            release_prescription_stock(stock_reference(prescription))
+        
         return jsonify({
             'success': True,
             'message': 'Ordonnance mise à jour avec succès',
@@ -310,9 +582,13 @@ def delete_prescription(prescription_id):
     """Supprimer une ordonnance"""
     try:
         prescription = Prescription.query.get_or_404(prescription_id)
+        reference = stock_reference(prescription) if prescription.status == 'active' else None
         db.session.delete(prescription)
         db.session.commit()
         
+        if reference:
+            release_prescription_stock(reference)
+        
         return jsonify({
             'success': True,
             'message': 'Ordonnance supprimée avec succès'
@@ -322,6 +598,47 @@ def delete_prescription(prescription_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/prescriptions/<int:prescription_id>/dispense', methods=['POST'])
+def dispense_prescription(prescription_id):
+    """Dispenser une ordonnance: convertir sa réservation de stock en ventes"""
+    try:
+        prescription = Prescription.query.options(selectinload(Prescription.medications)).get_or_404(prescription_id)
+        data = request.get_json(silent=True) or {}
+        
+        if prescription.status != 'active':
+            return jsonify({'success': False, 'error': f'Ordonnance {prescription.status}, dispensation impossible'}), 409
+        
+        # Un seul appel: les lignes réservées sont prélevées sur la réservation,
+        # les lignes ajoutées depuis (ou une réservation expirée) sur le stock disponible
+        try:
+            response = medicine_service.post(
+                f"/api/reservations/{stock_reference(prescription)}/consume",
+                json={'items': medication_totals(prescription.medications), 'user': data.get('user', prescription.doctor_name)}
+            )
+        except Exception as e:
+            print(f"Erreur dispensation: {e}")
+            return jsonify({'success': False, 'error': 'medicine-service indisponible'}), 503
+        
+        if response.status_code >= 500:
+            return jsonify({'success': False, 'error': 'medicine-service indisponible'}), 503
+        if response.status_code != 200:
+            return jsonify({'success': False, **response.json()}), response.status_code
+        
+        prescription.status = 'dispensed'
+        prescription.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Ordonnance dispensée avec succès',
+            'prescription': prescription.to_dict(),
+            'stock': response.json().get('stock', [])
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/prescriptions/<int:prescription_id>/medications', methods=['POST'])
 def add_medication_to_prescription(prescription_id):
     """Ajouter un médicament à une ordonnance existante"""
@@ -334,22 +651,29 @@ def add_medication_to_prescription(prescription_id):
         for field in required_fields:
             if field not in data:
                 return jsonify({'success': False, 'error': f'{field} est requis'}), 400
+        try:
+            medicine_id = int(data['medicine_id'])
+            quantity = int(data.get('quantity', 1))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'medicine_id et quantity doivent être des entiers'}), 400
+        if quantity <= 0:
+            return jsonify({'success': False, 'error': 'quantity doit être positive'}), 400
         
         # Récupérer le nom du médicament
-        medicine = get_medicine_info(data['medicine_id'])
+        medicine = get_medicine_info(medicine_id)
         if not medicine:
             return jsonify({'success': False, 'error': 'Médicament non trouvé'}), 404
         
         # Ajouter le médicament
         pres_med = PrescriptionMedication(
             prescription_id=prescription_id,
-            medicine_id=data['medicine_id'],
+            medicine_id=medicine_id,
             medicine_name=medicine['name'],
             dosage=data['dosage'],
             frequency=data['frequency'],
             duration=data['duration'],
             instructions=data.get('instructions'),
-            quantity=data.get('quantity', 1)
+            quantity=quantity
         )
         
         db.session.add(pres_med)
@@ -386,7 +710,8 @@ def remove_medication(medication_id):
 def get_patient_prescriptions(patient_id):
     """Récupérer toutes les ordonnances d'un patient"""
     try:
-        prescriptions = Prescription.query.filter_by(patient_id=patient_id)\
+        prescriptions = Prescription.query.options(selectinload(Prescription.medications))\
+            .filter_by(patient_id=patient_id)\
             .order_by(Prescription.prescription_date.desc())\
             .all()
         
@@ -399,21 +724,22 @@ def get_patient_prescriptions(patient_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/prescriptions/stats', methods=['GET'])
+@stats_cache.cached_response
 def get_prescription_stats():
     """Obtenir les statistiques des ordonnances"""
     try:
-        total = Prescription.query.count()
-        active = Prescription.query.filter_by(status='active').count()
-        expired = Prescription.query.filter_by(status='expired').count()
-        
         # Ordonnances ce mois
         first_day = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        this_month = Prescription.query.filter(
-            Prescription.prescription_date >= first_day
-        ).count()
+        
+        # Un COUNT par index (status, prescription_date) dans une seule requête
+        total, active, expired, this_month = db.session.query(
+            count_rows(Prescription),
+            count_rows(Prescription, Prescription.status == 'active'),
+            count_rows(Prescription, Prescription.status == 'expired'),
+            count_rows(Prescription, Prescription.prescription_date >= first_day)
+        ).one()
         
         # Médicaments les plus prescrits
-        from sqlalchemy import func
         most_prescribed = db.session.query(
             PrescriptionMedication.medicine_name,
             func.count(PrescriptionMedication.id).label('count')
@@ -452,10 +778,11 @@ def check_expiring_prescriptions():
             Prescription.valid_until >= today
         ).all()
         
+        patients = get_patients_info(pres.patient_id for pres in expiring)
         result = []
         for pres in expiring:
             pres_dict = pres.to_dict(include_medications=False)
-            patient = get_patient_info(pres.patient_id)
+            patient = patients.get(pres.patient_id)
             if patient:
                 pres_dict['patient'] = {
                     'name': f"{patient['first_name']} {patient['last_name']}",
@@ -473,11 +800,23 @@ def check_expiring_prescriptions():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CLI ====================
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Ajouter les index manquants à une base existante"""
+    create_missing_indexes()
+    print("✅ Index créés")
+
 # ==================== MAIN ====================
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        create_missing_indexes()
         print("✅ Prescription Service: Database tables created successfully!")
     
+    # Avec le reloader de debug, ne synchroniser que dans le processus servant les requêtes
+    if MEDICINE_CACHE_SYNC_INTERVAL > 0 and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_medicine_cache_sync()
+    
     port = int(os.getenv('PORT', 5004))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
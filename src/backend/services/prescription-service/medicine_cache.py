@@ -0,0 +1,106 @@
+# Cache local (LRU + TTL) des fiches médicaments lues dans le medicine-service.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class MedicineCache:
+    """Cache des médicaments par ID, borné et à durée de vie limitée
+
+    Les entrées expirent après `ttl` secondes; au-delà de `max_size` entrées,
+    la moins récemment lue est évincée. `invalidate` retire les médicaments
+    signalés comme modifiés ou supprimés par le flux de changements du
+    medicine-service.
+
+    Chaque invalidation incrémente la génération du cache: une lecture
+    lancée avant (génération relevée par `generation()` et passée à
+    `set_many`) peut rapporter une fiche périmée, elle n'est donc pas mise
+    en cache.
+    """
+
+    def __init__(self, ttl=300, max_size=5000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+        self._generation = 0
+        self.synced_at = None  # Horodatage (medicine-service) de la dernière synchronisation
+
+    def get_many(self, medicine_ids):
+        """Retourner ({medicine_id: médicament} trouvés, IDs absents ou expirés)"""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for medicine_id in medicine_ids:
+                entry = self._entries.get(medicine_id)
+                if entry is not None and now - entry[1] < self.ttl:
+                    self._entries.move_to_end(medicine_id)
+                    found[medicine_id] = entry[0]
+                else:
+                    if entry is not None:
+                        del self._entries[medicine_id]
+                    missing.append(medicine_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def get(self, medicine_id):
+        found, _ = self.get_many([medicine_id])
+        return found.get(medicine_id)
+
+    def generation(self):
+        """Génération courante, à relever avant de lire le medicine-service"""
+        with self._lock:
+            return self._generation
+
+    def set_many(self, medicines, generation=None):
+        """Mettre en cache des médicaments {medicine_id: médicament}
+
+        Si `generation` est donnée et qu'une invalidation a eu lieu depuis,
+        les médicaments ne sont pas mis en cache (lecture peut-être périmée).
+        """
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self.stale_sets += 1
+                return
+            for medicine_id, medicine in medicines.items():
+                self._entries[medicine_id] = (medicine, now)
+                self._entries.move_to_end(medicine_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, medicine_ids):
+        if not medicine_ids:
+            return
+        with self._lock:
+            self._generation += 1
+            for medicine_id in medicine_ids:
+                if self._entries.pop(medicine_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'stale_sets': self.stale_sets,
+                'synced_at': self.synced_at
+            }
@@ -0,0 +1,157 @@
+# Client HTTP partagé pour les appels entre microservices.
+# Fichier identique dans chaque service qui appelle un autre service
+# (chaque image Docker est construite à partir du dossier du service).
+
+import os
+import threading
+import time
+
+import requests
+from flask import has_request_context, request as current_request
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import record_http_call
+
+# Configuration (surchargeable par variables d'environnement)
+CONNECT_TIMEOUT = float(os.getenv('SERVICE_CONNECT_TIMEOUT', 2))
+READ_TIMEOUT = float(os.getenv('SERVICE_READ_TIMEOUT', 5))
+RETRIES = int(os.getenv('SERVICE_RETRIES', 2))
+RETRY_BACKOFF = float(os.getenv('SERVICE_RETRY_BACKOFF', 0.2))
+POOL_SIZE = int(os.getenv('SERVICE_POOL_SIZE', 20))
+
+# Jeton de service (flask issue-service-token dans l'auth-service), envoyé
+# quand il n'y a pas de jeton d'utilisateur à transmettre
+SERVICE_TOKEN = os.getenv('SERVICE_TOKEN')
+if os.getenv('SERVICE_TOKEN_FILE'):
+    with open(os.getenv('SERVICE_TOKEN_FILE')) as f:
+        SERVICE_TOKEN = f.read().strip()
+
+
+class ServiceClient:
+    """Client HTTP vers un service amont
+
+    Garde les connexions ouvertes (keep-alive) dans un pool dédié, applique des
+    timeouts de connexion/lecture et relance les GET en cas d'échec réseau ou
+    de réponse 502/503/504. Les requêtes non idempotentes ne sont pas relancées.
+    """
+
+    def __init__(self, base_url, name=None):
+        self.base_url = base_url.rstrip('/')
+        self.name = name or self.base_url
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+
+    def request(self, method, path, **kwargs):
+        """Envoyer une requête vers le service (path relatif à base_url)
+
+        Pendant le traitement d'une requête, son en-tête Authorization est
+        transmis au service appelé (vérification locale du même jeton). Sans
+        jeton d'utilisateur (thread de fond, route publique), le jeton de
+        service SERVICE_TOKEN est envoyé s'il est configuré.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if has_request_context() and 'Authorization' in current_request.headers:
+            authorization = current_request.headers['Authorization']
+        elif SERVICE_TOKEN:
+            authorization = f'Bearer {SERVICE_TOKEN}'
+        else:
+            authorization = None
+        if authorization:
+            headers = dict(kwargs.get('headers') or {})
+            headers.setdefault('Authorization', authorization)
+            kwargs['headers'] = headers
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._record(elapsed_ms, failed)
+            record_http_call(elapsed_ms, method, f"{self.base_url}{path}")
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def _record(self, elapsed_ms, failed):
+        with self._lock:
+            self._requests += 1
+            self._errors += 1 if failed else 0
+            self._total_ms += elapsed_ms
+            self._max_ms = max(self._max_ms, elapsed_ms)
+
+    def stats(self):
+        """Métriques de latence et d'utilisation du pool de connexions"""
+        pools = self.adapter.poolmanager.pools
+        connections_opened = 0
+        pool_requests = 0
+        for key in pools.keys():
+            pool = pools[key]
+            if pool is not None:
+                connections_opened += pool.num_connections
+                pool_requests += pool.num_requests
+
+        with self._lock:
+            return {
+                'name': self.name,
+                'base_url': self.base_url,
+                'requests': self._requests,
+                'errors': self._errors,
+                'avg_ms': round(self._total_ms / self._requests, 2) if self._requests else 0.0,
+                'max_ms': round(self._max_ms, 2),
+                'pool': {
+                    'max_size': POOL_SIZE,
+                    'connections_opened': connections_opened,
+                    'requests_sent': pool_requests
+                }
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, name=None):
+    """Retourner le client partagé pour un service amont (créé au premier appel)"""
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = ServiceClient(base_url, name=name)
+            _clients[base_url] = client
+        return client
+
+
+def clients_stats():
+    """Métriques de tous les clients créés par ce service"""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return [client.stats() for client in clients]